@@ -0,0 +1,136 @@
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import Request, Response
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import settings
+
+# The marts only change when the pipeline runs. After dbt_marts succeeds the
+# pipeline bumps the version in this table (scripts/bump_data_version.py); the
+# version is part of every cache key and ETag, so a bump invalidates everything.
+DATA_VERSION_TABLE = "public.data_version"
+
+class TTLCache:
+    """In-process LRU cache whose entries expire `ttl` seconds after being set."""
+    def __init__(self, max_entries: int, ttl: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    async def set(self, key: str, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+class RedisCache:
+    """Shared cache for several API workers, on any Redis-compatible server."""
+    def __init__(self, url: str, ttl: int):
+        import redis.asyncio
+        self.client = redis.asyncio.Redis.from_url(url)
+        self.ttl = ttl
+
+    async def get(self, key: str):
+        raw = await self.client.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value):
+        # Dates become ISO strings; the response models parse them back
+        await self.client.setex(key, self.ttl, json.dumps(value, default=str))
+
+class NullCache:
+    async def get(self, key: str):
+        return None
+
+    async def set(self, key: str, value):
+        pass
+
+def build_cache():
+    if settings.CACHE_BACKEND == "redis":
+        return RedisCache(settings.REDIS_URL, settings.CACHE_TTL_SECONDS)
+    if settings.CACHE_BACKEND == "memory":
+        return TTLCache(settings.CACHE_MAX_ENTRIES, settings.CACHE_TTL_SECONDS)
+    return NullCache()
+
+cache = build_cache()
+
+# (checked_at, version, updated_at): the version is re-read at most every
+# VERSION_CHECK_SECONDS so cache hits don't cost a database round trip
+_version_state = {"checked_at": 0.0, "version": "0", "updated_at": None}
+
+async def get_data_version(db: AsyncSession):
+    now = time.monotonic()
+    if now - _version_state["checked_at"] >= settings.VERSION_CHECK_SECONDS:
+        try:
+            row = (await db.execute(text(f"SELECT version, updated_at FROM {DATA_VERSION_TABLE} WHERE id = 1"))).fetchone()
+        except Exception:
+            # Table not created yet (pipeline never ran): everything shares version "0"
+            await db.rollback()
+            row = None
+        if row:
+            updated_at = row[1]
+            if updated_at is not None:
+                updated_at = updated_at.replace(tzinfo=timezone.utc) if updated_at.tzinfo is None else updated_at.astimezone(timezone.utc)
+            _version_state.update(version=str(row[0]), updated_at=updated_at)
+        _version_state["checked_at"] = now
+    return _version_state["version"], _version_state["updated_at"]
+
+def _is_not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            return last_modified.replace(microsecond=0) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+async def cached_response(request: Request, response: Response, db: AsyncSession, endpoint: str, params: dict, compute):
+    """
+    Serves `await compute()` through the cache, keyed by endpoint, parameters and data
+    version, and sets ETag/Last-Modified. Returns None (uncached) if compute does;
+    otherwise a bare 304 Response when the client's validators still match.
+    """
+    version, updated_at = await get_data_version(db)
+    key = f"{endpoint}:{version}:{json.dumps(params, sort_keys=True, default=str)}"
+    etag = f'W/"{hashlib.sha1(key.encode()).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if updated_at is not None:
+        headers["Last-Modified"] = format_datetime(updated_at, usegmt=True)
+
+    # Validators are only honoured for resources that exist: a missing one
+    # (compute returns None) must still get its 404, even for If-None-Match: *
+    data = await cache.get(key)
+    if data is None:
+        data = await compute()
+        if data is None:
+            return None
+        await cache.set(key, data)
+
+    if _is_not_modified(request, etag, updated_at):
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    return data
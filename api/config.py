@@ -14,8 +14,32 @@ class Config:
     POSTGRES_PORT: str = os.getenv("POSTGRES_PORT", "5432")
     POSTGRES_DB: str = os.getenv("POSTGRES_DB", "medical_warehouse")
     
+    # Connection pool for the async engine
+    DB_POOL_SIZE: int = int(os.getenv("API_DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("API_DB_MAX_OVERFLOW", "20"))
+    DB_POOL_TIMEOUT: int = int(os.getenv("API_DB_POOL_TIMEOUT", "30"))
+    DB_POOL_PRE_PING: bool = os.getenv("API_DB_POOL_PRE_PING", "true").lower() == "true"
+    # Server-side cap on any single query, in milliseconds (0 disables)
+    DB_STATEMENT_TIMEOUT_MS: int = int(os.getenv("API_DB_STATEMENT_TIMEOUT_MS", "15000"))
+    
+    # Response cache: "memory" (per-process TTL LRU), "redis" or "none"
+    CACHE_BACKEND: str = os.getenv("API_CACHE_BACKEND", "memory").lower()
+    CACHE_TTL_SECONDS: int = int(os.getenv("API_CACHE_TTL_SECONDS", "86400"))
+    CACHE_MAX_ENTRIES: int = int(os.getenv("API_CACHE_MAX_ENTRIES", "1024"))
+    REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    # How often the data version bumped by the pipeline is re-read
+    VERSION_CHECK_SECONDS: int = int(os.getenv("API_VERSION_CHECK_SECONDS", "10"))
+    
+    # Bulk export: rows per keyset query, and rows per server-side cursor fetch
+    EXPORT_PAGE_SIZE: int = int(os.getenv("API_EXPORT_PAGE_SIZE", "50000"))
+    EXPORT_FETCH_SIZE: int = int(os.getenv("API_EXPORT_FETCH_SIZE", "2000"))
+    
     @property
     def DATABASE_URL(self) -> str:
         return f"postgresql://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_SERVER}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
 
+    @property
+    def ASYNC_DATABASE_URL(self) -> str:
+        return f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_SERVER}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
+
 settings = Config()
@@ -1,114 +1,192 @@
-from sqlalchemy.orm import Session
+import json
+import base64
+from datetime import date, datetime, timedelta
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 from sqlalchemy import text
 from typing import List, Optional
 from . import schemas
 
-def get_top_products(db: Session, limit: int = 10):
-    # Endpoint 1: Extract terms from message_text (splitting by spaces and filtering basic medical keywords)
-    # We use a regex based split on the database side for efficiency
-    query = text("""
-        WITH words AS (
-            SELECT lower(regexp_split_to_table(message_text, '\s+')) as word
-            FROM public.fct_messages
-            WHERE message_text IS NOT NULL AND message_text != ''
-        )
-        SELECT word as product_name, count(*) as mention_count
-        FROM words
-        WHERE length(word) > 4 -- Filter out small words/stop-words
-        AND word ~ '^[a-z]+$' -- Only alphabetic terms
-        GROUP BY word
+# Default span of the channel activity trends when no start_date is given
+TREND_WINDOW_DAYS = 182
+# Calendar days in the daily trend, ending at the window's end
+DAILY_TREND_DAYS = 30
+
+async def get_top_products(
+    db: AsyncSession,
+    limit: int = 10,
+    channel_name: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+):
+    # Endpoint 1: Top terms from the precomputed fct_term_mentions mart (tokenized
+    # and stopword-filtered by dbt), optionally narrowed to a channel and date range
+    joins = []
+    filters = []
+    params = {"limit": limit}
+    if channel_name:
+        joins.append("JOIN public.dim_channels c ON t.channel_key = c.channel_key")
+        filters.append("c.channel_name = :channel_name")
+        params["channel_name"] = channel_name
+    if start_date or end_date:
+        joins.append("JOIN public.dim_dates d ON t.date_key = d.date_key")
+        if start_date:
+            filters.append("d.full_date >= :start_date")
+            params["start_date"] = start_date
+        if end_date:
+            filters.append("d.full_date <= :end_date")
+            params["end_date"] = end_date
+
+    query = text(f"""
+        SELECT t.term as product_name, sum(t.mention_count) as mention_count
+        FROM public.fct_term_mentions t
+        {" ".join(joins)}
+        {"WHERE " + " AND ".join(filters) if filters else ""}
+        GROUP BY t.term
         ORDER BY mention_count DESC
         LIMIT :limit
     """)
-    result = db.execute(query, {"limit": limit})
+    result = await db.execute(query, params)
     return [{"product_name": row[0], "mention_count": row[1]} for row in result]
 
-def get_channel_activity(db: Session, channel_name: str):
-    # Check if channel exists in dim_channels
-    channel_query = text("SELECT channel_key FROM public.dim_channels WHERE channel_name = :name")
-    channel = db.execute(channel_query, {"name": channel_name}).fetchone()
-    
-    if not channel:
-        return None
-        
-    # Metrics
-    metrics_query = text("""
-        SELECT 
-            count(*) as total_posts,
-            coalesce(avg(view_count), 0) as avg_views
-        FROM public.fct_messages f
-        JOIN public.dim_channels c ON f.channel_key = c.channel_key
-        WHERE c.channel_name = :name
-    """)
-    metrics = db.execute(metrics_query, {"name": channel_name}).fetchone()
-    
-    # Daily Trend
-    daily_query = text("""
-        SELECT d.full_date, count(f.message_id) 
-        FROM public.fct_messages f
-        JOIN public.dim_dates d ON f.date_key = d.date_key
-        JOIN public.dim_channels c ON f.channel_key = c.channel_key
-        WHERE c.channel_name = :name
-        GROUP BY d.full_date
-        ORDER BY d.full_date DESC
-        LIMIT 30
-    """)
-    daily_trend = db.execute(daily_query, {"name": channel_name}).fetchall()
-    
-    # Weekly Trend
-    weekly_query = text("""
-        SELECT d.week_of_year, count(f.message_id)
-        FROM public.fct_messages f
-        JOIN public.dim_dates d ON f.date_key = d.date_key
-        JOIN public.dim_channels c ON f.channel_key = c.channel_key
-        WHERE c.channel_name = :name
-        GROUP BY d.week_of_year
-        ORDER BY d.week_of_year DESC
+async def get_channel_activity(
+    db: AsyncSession,
+    channel_name: str,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+):
+    """
+    Channel metrics and trends from the agg_channel_daily mart in one round trip.
+    Totals cover the channel's whole history; the daily (last DAILY_TREND_DAYS
+    calendar days, days without posts as 0) and weekly trends cover
+    [start_date, end_date], which defaults to the TREND_WINDOW_DAYS ending on
+    the channel's latest post. Returns None for unknown channels.
+    """
+    query = text("""
+        WITH channel AS (
+            SELECT channel_key FROM public.dim_channels WHERE channel_name = :name
+        ),
+        daily AS (
+            SELECT a.full_date, a.iso_year, a.iso_week, a.post_count,
+                   a.viewed_post_count, a.total_views, a.total_forwards
+            FROM public.agg_channel_daily a
+            JOIN channel c ON a.channel_key = c.channel_key
+        ),
+        bounds AS (
+            SELECT e.end_date, coalesce(CAST(:start_date AS date), e.end_date - CAST(:window_days AS integer)) AS start_date
+            FROM (SELECT coalesce(CAST(:end_date AS date), max(full_date)) AS end_date FROM daily) e
+        ),
+        trend AS (
+            SELECT d.*
+            FROM daily d, bounds b
+            WHERE d.full_date <= b.end_date
+              AND d.full_date >= b.start_date
+        )
+        SELECT
+            (SELECT count(*) FROM channel) AS channel_found,
+            (SELECT coalesce(sum(post_count), 0) FROM daily) AS total_posts,
+            (SELECT coalesce(sum(total_views)::numeric / nullif(sum(viewed_post_count), 0), 0) FROM daily) AS avg_views,
+            (SELECT coalesce(sum(total_forwards), 0) FROM daily) AS total_forwards,
+            -- agg_channel_daily only has days with posts: fill the calendar days in between with 0
+            (SELECT coalesce(json_agg(json_build_object('date', s.day, 'post_count', coalesce(t.post_count, 0)) ORDER BY s.day DESC), '[]')::text
+             FROM bounds b
+             CROSS JOIN LATERAL (
+                 SELECT CAST(g AS date) AS day
+                 FROM generate_series(CAST(greatest(b.start_date, b.end_date - CAST(:daily_days AS integer) + 1) AS timestamp), CAST(b.end_date AS timestamp), interval '1 day') g
+             ) s
+             LEFT JOIN trend t ON t.full_date = s.day) AS daily_trend,
+            (SELECT coalesce(json_agg(json_build_object('year', iso_year, 'week', iso_week, 'post_count', post_count) ORDER BY iso_year DESC, iso_week DESC), '[]')::text
+             FROM (SELECT iso_year, iso_week, sum(post_count) AS post_count FROM trend GROUP BY iso_year, iso_week) w) AS weekly_trend
     """)
-    weekly_trend = db.execute(weekly_query, {"name": channel_name}).fetchall()
-    
+    row = (await db.execute(query, {
+        "name": channel_name,
+        "start_date": start_date,
+        "end_date": end_date,
+        "window_days": TREND_WINDOW_DAYS,
+        "daily_days": DAILY_TREND_DAYS
+    })).fetchone()
+
+    if not row.channel_found:
+        return None
+
     return {
         "channel_name": channel_name,
-        "total_posts": metrics[0],
-        "avg_views": round(metrics[1], 2),
-        "daily_trend": [{"date": row[0], "post_count": row[1]} for row in daily_trend],
-        "weekly_trend": [{"week": row[0], "post_count": row[1]} for row in weekly_trend]
+        "total_posts": row.total_posts,
+        "avg_views": round(float(row.avg_views), 2),
+        "total_forwards": row.total_forwards,
+        "daily_trend": json.loads(row.daily_trend),
+        "weekly_trend": json.loads(row.weekly_trend)
     }
 
-def search_messages(db: Session, query_str: str, limit: int = 20):
-    query = text("""
+def encode_search_cursor(row):
+    # Opaque keyset cursor: the sort key of the last row on the page
+    key = [row["rank"], row["date"].isoformat(), row["channel_key"], row["message_id"]]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+def decode_search_cursor(cursor: str):
+    try:
+        rank, date_str, channel_key, message_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return {"rank": float(rank), "date": datetime.fromisoformat(date_str), "channel_key": str(channel_key), "message_id": int(message_id)}
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+async def search_messages(db: AsyncSession, query_str: str, limit: int = 20, cursor: Optional[str] = None):
+    """
+    Full-text search over fct_messages.search_vector (GIN-indexed). The query
+    accepts web-search syntax (multiple terms, "quoted phrases", OR, -exclude);
+    results are ranked by ts_rank_cd, newest first on ties, and paginated with
+    a keyset cursor so deep pages cost the same as the first one.
+    """
+    after = decode_search_cursor(cursor) if cursor else None
+    query = text(f"""
+        WITH matches AS (
+            SELECT 
+                f.message_id, 
+                f.channel_key, 
+                f.message_date, 
+                f.message_text, 
+                f.view_count,
+                ts_rank_cd(f.search_vector, q) as rank
+            FROM public.fct_messages f,
+                 websearch_to_tsquery('simple', :q) q
+            WHERE f.search_vector @@ q
+        )
         SELECT 
-            f.message_id, 
+            m.message_id, 
             c.channel_name, 
-            d.full_date, 
-            f.message_text, 
-            f.view_count
-        FROM public.fct_messages f
-        JOIN public.dim_channels c ON f.channel_key = c.channel_key
-        JOIN public.dim_dates d ON f.date_key = d.date_key
-        WHERE f.message_text ILIKE :q
-        ORDER BY d.full_date DESC
+            m.message_date, 
+            m.message_text, 
+            m.view_count,
+            m.rank,
+            m.channel_key
+        FROM matches m
+        JOIN public.dim_channels c ON m.channel_key = c.channel_key
+        {"WHERE (m.rank, m.message_date, m.channel_key, m.message_id) < (CAST(:rank AS real), CAST(:date AS timestamp), CAST(:channel_key AS text), CAST(:message_id AS bigint))" if after else ""}
+        ORDER BY m.rank DESC, m.message_date DESC, m.channel_key DESC, m.message_id DESC
         LIMIT :limit
     """)
-    result = db.execute(query, {"q": f"%{query_str}%", "limit": limit})
-    return [
+    result = await db.execute(query, {"q": query_str, "limit": limit, **(after or {})})
+    results = [
         {
             "message_id": row[0],
             "channel_name": row[1],
             "date": row[2],
             "text": row[3],
-            "views": row[4]
+            "views": row[4],
+            "rank": row[5],
+            "channel_key": row[6]
         } for row in result
     ]
+    next_cursor = encode_search_cursor(results[-1]) if len(results) == limit else None
+    return results, next_cursor
 
-def get_visual_stats(db: Session):
+async def get_visual_stats(db: AsyncSession):
     # Distribution of image categories
     dist_query = text("""
         SELECT image_category, count(*) 
         FROM public.fct_image_detections
         GROUP BY image_category
     """)
-    distribution = db.execute(dist_query).fetchall()
+    distribution = (await db.execute(dist_query)).fetchall()
     
     # Visual usage by channel
     channel_query = text("""
@@ -120,7 +198,20 @@ def get_visual_stats(db: Session):
         JOIN public.dim_channels c ON f.channel_key = c.channel_key
         GROUP BY c.channel_name
     """)
-    channel_stats = db.execute(channel_query).fetchall()
+    channel_stats = (await db.execute(channel_query)).fetchall()
+
+    # Detections per object class, from the one-row-per-box fact table
+    class_query = text("""
+        SELECT
+            class_name,
+            count(*) as detection_count,
+            count(DISTINCT (channel_key, message_id)) as image_count,
+            avg(confidence) as avg_confidence
+        FROM public.fct_detection_boxes
+        GROUP BY class_name
+        ORDER BY detection_count DESC
+    """)
+    class_counts = (await db.execute(class_query)).fetchall()
     
     return {
         "image_category_distribution": [{"category": row[0], "count": row[1]} for row in distribution],
@@ -131,5 +222,116 @@ def get_visual_stats(db: Session):
                 "total_posts": row[2],
                 "visual_percentage": round((row[1] / row[2] * 100), 2) if row[2] > 0 else 0
             } for row in channel_stats
+        ],
+        "class_counts": [
+            {
+                "class_name": row[0],
+                "detection_count": row[1],
+                "image_count": row[2],
+                "avg_confidence": round(float(row[3]), 2)
+            } for row in class_counts
         ]
     }
+
+# Bulk export datasets: the fact table and the columns streamed for each
+EXPORT_DATASETS = {
+    "messages": {
+        "table": "public.fct_messages",
+        "message_date": "f.message_date",
+        "joins": [],
+        "columns": ["f.message_text", "f.message_length", "f.view_count", "f.forward_count", "f.has_media"]
+    },
+    "detections": {
+        "table": "public.fct_image_detections",
+        # Detections take their message's date, so both exports share one order
+        "message_date": "m.message_date",
+        "joins": ["JOIN public.fct_messages m ON f.channel_key = m.channel_key AND f.message_id = m.message_id"],
+        "columns": ["f.detected_class", "f.confidence_score", "f.image_category"]
+    }
+}
+
+def parse_export_after(after: str):
+    # Resume point: "<message_date>,<channel_key>,<message_id>" of the last row received
+    try:
+        message_date, channel_key, message_id = after.split(",")
+        return {
+            "after_message_date": datetime.fromisoformat(message_date),
+            "after_channel_key": channel_key,
+            "after_message_id": int(message_id)
+        }
+    except ValueError as e:
+        raise ValueError(f"Invalid after: {after}") from e
+
+async def iter_export_pages(
+    engine: AsyncEngine,
+    dataset: str,
+    channel_name: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    after: Optional[dict] = None,
+    page_size: int = 50000,
+    fetch_size: int = 1000
+):
+    """
+    Yields lists of row dicts covering the whole export, in chronological
+    (message_date, channel_key, message_id) order. Each page of `page_size` rows
+    is a separate keyset query on the fct_messages index of the same columns,
+    streamed from a server-side cursor `fetch_size` rows at a time, so no
+    statement runs long and memory stays flat however large the export is.
+    Opens its own connection: the response outlives the request session.
+    """
+    spec = EXPORT_DATASETS[dataset]
+    message_date = spec["message_date"]
+    filters = []
+    params = {"page_size": page_size}
+    if channel_name:
+        filters.append("c.channel_name = :channel_name")
+        params["channel_name"] = channel_name
+    # Bounds on message_date itself, so they narrow the index range scan
+    if start_date:
+        filters.append(f"{message_date} >= :start_date")
+        params["start_date"] = datetime.combine(start_date, datetime.min.time())
+    if end_date:
+        filters.append(f"{message_date} < :end_before")
+        params["end_before"] = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+    keyset = f"({message_date}, f.channel_key, f.message_id) > (:after_message_date, :after_channel_key, :after_message_id)"
+
+    def page_query(resume: bool):
+        where = filters + [keyset] if resume else filters
+        return text(f"""
+            SELECT
+                {message_date} AS message_date,
+                f.channel_key,
+                f.message_id,
+                c.channel_name,
+                CAST({message_date} AS date) AS full_date,
+                {", ".join(spec["columns"])}
+            FROM {spec["table"]} f
+            {" ".join(spec["joins"])}
+            JOIN public.dim_channels c ON f.channel_key = c.channel_key
+            {"WHERE " + " AND ".join(where) if where else ""}
+            ORDER BY {message_date}, f.channel_key, f.message_id
+            LIMIT :page_size
+        """)
+
+    async with engine.connect() as conn:
+        while True:
+            if after:
+                params.update(after)
+            result = await conn.stream(page_query(after is not None), params)
+            count = 0
+            last = None
+            async for partition in result.mappings().partitions(fetch_size):
+                rows = [dict(row) for row in partition]
+                count += len(rows)
+                last = rows[-1]
+                yield rows
+            # End the page's transaction so the snapshot isn't held between pages
+            await conn.rollback()
+            if count < page_size:
+                break
+            after = {
+                "after_message_date": last["message_date"],
+                "after_channel_key": last["channel_key"],
+                "after_message_id": last["message_id"]
+            }
@@ -0,0 +1,90 @@
+import io
+import csv
+import json
+from datetime import date, datetime
+
+from .crud import EXPORT_DATASETS
+
+# Content types of the supported export formats
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream"
+}
+
+EXPORT_EXTENSIONS = {"ndjson": "ndjson", "csv": "csv", "arrow": "arrows"}
+
+def arrow_schema(dataset: str):
+    """Fixed Arrow schemas, so an empty export still carries its columns and types."""
+    import pyarrow as pa
+    keys = [
+        ("message_date", pa.timestamp("us")),
+        ("channel_key", pa.string()),
+        ("message_id", pa.int64()),
+        ("channel_name", pa.string()),
+        ("full_date", pa.date32())
+    ]
+    if dataset == "messages":
+        return pa.schema(keys + [
+            ("message_text", pa.string()),
+            ("message_length", pa.int64()),
+            ("view_count", pa.int64()),
+            ("forward_count", pa.int64()),
+            ("has_media", pa.bool_())
+        ])
+    return pa.schema(keys + [
+        ("detected_class", pa.string()),
+        ("confidence_score", pa.float64()),
+        ("image_category", pa.string())
+    ])
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+async def encode_ndjson(pages):
+    async for rows in pages:
+        yield "".join(json.dumps(row, default=_json_default, ensure_ascii=False) + "\n" for row in rows).encode("utf-8")
+
+async def encode_csv(pages, columns):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns)
+    writer.writeheader()
+    async for rows in pages:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only, when the export is empty
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+async def encode_arrow(pages, schema):
+    """Arrow IPC stream: one record batch per fetched partition."""
+    import pyarrow as pa
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        async for rows in pages:
+            writer.write_batch(pa.RecordBatch.from_pylist(rows, schema=schema))
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    # End-of-stream marker written on close
+    yield sink.getvalue()
+
+def export_columns(dataset: str):
+    # Same order as the Arrow schema; names only, so CSV doesn't need pyarrow
+    keys = ["message_date", "channel_key", "message_id", "channel_name", "full_date"]
+    return keys + [column.split(".", 1)[1] for column in EXPORT_DATASETS[dataset]["columns"]]
+
+def encode_export(pages, dataset: str, fmt: str):
+    """
+    Wraps an async iterator of row pages in a byte-chunk encoder for `fmt`.
+    Raises ImportError up front if arrow is requested without pyarrow installed.
+    """
+    if fmt == "arrow":
+        return encode_arrow(pages, arrow_schema(dataset))
+    if fmt == "csv":
+        return encode_csv(pages, export_columns(dataset))
+    return encode_ndjson(pages)
@@ -1,9 +1,13 @@
-from fastapi import FastAPI, Depends, HTTPException, Query
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional
+from datetime import date
 
 from . import crud, schemas, database
+from .cache import cached_response
+from .export import EXPORT_EXTENSIONS, EXPORT_MEDIA_TYPES, encode_export
 from .config import settings
 
 app = FastAPI(
@@ -26,47 +30,135 @@ async def root():
     return {"message": "Welcome to the Medical Telegram Warehouse Analytical API", "docs": "/docs"}
 
 @app.get("/api/reports/top-products", response_model=schemas.TopProductsResponse)
-def get_top_products(
+async def get_top_products(
+    request: Request,
+    response: Response,
     limit: int = Query(10, description="Number of top products to return", gt=0, le=100),
-    db: Session = Depends(database.get_db)
+    channel: Optional[str] = Query(None, description="Only count mentions in this channel"),
+    start_date: Optional[date] = Query(None, description="Only count mentions on or after this date"),
+    end_date: Optional[date] = Query(None, description="Only count mentions on or before this date"),
+    db: AsyncSession = Depends(database.get_db)
 ):
     """
     Returns the most frequently mentioned medical products/terms extracted from messages.
     """
-    data = crud.get_top_products(db, limit)
-    return {"data": data}
+    async def top_products():
+        return {"data": await crud.get_top_products(db, limit, channel, start_date, end_date)}
+
+    return await cached_response(
+        request, response, db, "top-products",
+        {"limit": limit, "channel": channel, "start_date": start_date, "end_date": end_date},
+        top_products
+    )
 
 @app.get("/api/channels/{channel_name}/activity", response_model=schemas.ChannelActivityResponse)
-def get_channel_activity(
+async def get_channel_activity(
     channel_name: str,
-    db: Session = Depends(database.get_db)
+    request: Request,
+    response: Response,
+    start_date: Optional[date] = Query(None, description="Start of the trend window (defaults to ~26 weeks before end_date)"),
+    end_date: Optional[date] = Query(None, description="End of the trend window (defaults to the channel's latest post)"),
+    db: AsyncSession = Depends(database.get_db)
 ):
     """
-    Returns posting activity, average views, and trends for a specific channel.
+    Returns posting activity, average views, and daily/weekly trends for a specific channel.
     """
-    data = crud.get_channel_activity(db, channel_name)
+    if start_date and end_date and start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date must not be after end_date")
+    data = await cached_response(
+        request, response, db, "channel-activity",
+        {"channel_name": channel_name, "start_date": start_date, "end_date": end_date},
+        lambda: crud.get_channel_activity(db, channel_name, start_date, end_date)
+    )
     if data is None:
         raise HTTPException(status_code=404, detail="Channel not found")
     return data
 
 @app.get("/api/search/messages", response_model=schemas.MessageSearchResponse)
-def search_messages(
-    query: str = Query(..., min_length=1, description="Keyword to search in messages"),
+async def search_messages(
+    request: Request,
+    response: Response,
+    query: str = Query(..., min_length=1, description="Search terms; supports \"phrases\", OR and -exclusions"),
     limit: int = Query(20, description="Max results to return", gt=0, le=100),
-    db: Session = Depends(database.get_db)
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    db: AsyncSession = Depends(database.get_db)
 ):
     """
-    Search for messages containing a specific keyword.
+    Full-text search over messages, ranked by relevance and paginated with a cursor.
     """
-    results = crud.search_messages(db, query, limit)
-    return {"query": query, "results": results}
+    async def search():
+        results, next_cursor = await crud.search_messages(db, query, limit, cursor)
+        return {"query": query, "results": results, "next_cursor": next_cursor}
+
+    try:
+        return await cached_response(
+            request, response, db, "search-messages",
+            {"query": query, "limit": limit, "cursor": cursor}, search
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/api/reports/visual-content", response_model=schemas.VisualContentResponse)
-def get_visual_stats(db: Session = Depends(database.get_db)):
+async def get_visual_stats(request: Request, response: Response, db: AsyncSession = Depends(database.get_db)):
+    """
+    Analyze image usage and classification (YOLO) across all channels,
+    with detection counts per object class.
+    """
+    return await cached_response(request, response, db, "visual-content", {}, lambda: crud.get_visual_stats(db))
+
+def export_response(
+    dataset: str,
+    format: str,
+    channel: Optional[str],
+    start_date: Optional[date],
+    end_date: Optional[date],
+    after: Optional[str]
+):
+    if start_date and end_date and start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date must not be after end_date")
+    try:
+        resume = crud.parse_export_after(after) if after else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    pages = crud.iter_export_pages(
+        database.engine, dataset, channel, start_date, end_date, resume,
+        page_size=settings.EXPORT_PAGE_SIZE, fetch_size=settings.EXPORT_FETCH_SIZE
+    )
+    try:
+        body = encode_export(pages, dataset, format)
+    except ImportError:
+        raise HTTPException(status_code=501, detail="Arrow export requires pyarrow to be installed")
+    return StreamingResponse(
+        body,
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{dataset}.{EXPORT_EXTENSIONS[format]}"'}
+    )
+
+@app.get("/api/export/messages")
+async def export_messages(
+    format: Literal["ndjson", "csv", "arrow"] = Query("ndjson", description="ndjson, csv or arrow (Arrow IPC stream)"),
+    channel: Optional[str] = Query(None, description="Only export this channel"),
+    start_date: Optional[date] = Query(None, description="Only export messages on or after this date"),
+    end_date: Optional[date] = Query(None, description="Only export messages on or before this date"),
+    after: Optional[str] = Query(None, description="Resume after this row: \"<message_date>,<channel_key>,<message_id>\""),
+):
+    """
+    Streams fct_messages in (message_date, channel_key, message_id) order, without a row limit.
+    """
+    return export_response("messages", format, channel, start_date, end_date, after)
+
+@app.get("/api/export/detections")
+async def export_detections(
+    format: Literal["ndjson", "csv", "arrow"] = Query("ndjson", description="ndjson, csv or arrow (Arrow IPC stream)"),
+    channel: Optional[str] = Query(None, description="Only export this channel"),
+    start_date: Optional[date] = Query(None, description="Only export detections for messages on or after this date"),
+    end_date: Optional[date] = Query(None, description="Only export detections for messages on or before this date"),
+    after: Optional[str] = Query(None, description="Resume after this row: \"<message_date>,<channel_key>,<message_id>\""),
+):
     """
-    Analyze image usage and classification (YOLO) across all channels.
+    Streams fct_image_detections in (message_date, channel_key, message_id) order, without a row limit.
     """
-    return crud.get_visual_stats(db)
+    return export_response("detections", format, channel, start_date, end_date, after)
 
 if __name__ == "__main__":
     import uvicorn
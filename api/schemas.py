@@ -16,6 +16,7 @@ class DailyTrend(BaseModel):
     post_count: int
 
 class WeeklyTrend(BaseModel):
+    year: int
     week: int
     post_count: int
 
@@ -23,6 +24,7 @@ class ChannelActivityResponse(BaseModel):
     channel_name: str
     total_posts: int
     avg_views: float
+    total_forwards: int
     daily_trend: List[DailyTrend]
     weekly_trend: List[WeeklyTrend]
 
@@ -33,10 +35,12 @@ class MessageSearchItem(BaseModel):
     date: datetime
     text: Optional[str]
     views: Optional[int]
+    rank: float
 
 class MessageSearchResponse(BaseModel):
     query: str
     results: List[MessageSearchItem]
+    next_cursor: Optional[str] = None
 
 # Endpoint 4: Visual Content Statistics
 class ImageCategoryDistribution(BaseModel):
@@ -49,6 +53,13 @@ class ChannelVisualStats(BaseModel):
     total_posts: int
     visual_percentage: float
 
+class DetectedClassCount(BaseModel):
+    class_name: str
+    detection_count: int
+    image_count: int
+    avg_confidence: float
+
 class VisualContentResponse(BaseModel):
     image_category_distribution: List[ImageCategoryDistribution]
     channel_visual_stats: List[ChannelVisualStats]
+    class_counts: List[DetectedClassCount]
@@ -0,0 +1,13 @@
+{#
+    Optional physical layout for the fact tables: physically orders the table
+    by `column` with CLUSTER so range scans on it touch few pages.
+    CLUSTER rewrites the whole table, so this only runs when the project is
+    built with --vars '{cluster_facts: true}' (e.g. in a weekly maintenance run).
+#}
+{% macro cluster_table(column) %}
+    {% if var('cluster_facts', false) %}
+        create index if not exists "{{ this.identifier }}_{{ column }}_cluster_idx" on {{ this }} ({{ column }});
+        cluster {{ this }} using "{{ this.identifier }}_{{ column }}_cluster_idx";
+        analyze {{ this }};
+    {% endif %}
+{% endmacro %}
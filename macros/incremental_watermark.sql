@@ -0,0 +1,12 @@
+{#
+    Lower bound on loaded_at for an incremental run: the newest loaded_at
+    already in {{ this }}, minus the `incremental_lookback` overlap window.
+    Loaders stamp rows with their transaction's start time, so a load that
+    commits after a dbt run can still carry timestamps older than that run's
+    watermark; re-scanning the overlap picks those rows up. The models are
+    delete+insert on their unique key, so rows seen twice are just rebuilt.
+    The window must exceed the longest load transaction.
+#}
+{% macro incremental_watermark() %}
+    ((select coalesce(max(loaded_at), '1900-01-01') from {{ this }}) - interval '{{ var("incremental_lookback", "1 hour") }}')
+{% endmacro %}
@@ -0,0 +1,42 @@
+{{ config(
+    materialized='incremental',
+    incremental_strategy='delete+insert',
+    unique_key=['channel_key', 'date_key'],
+    indexes=[
+        {'columns': ['channel_key', 'full_date'], 'unique': True},
+        {'columns': ['date_key']}
+    ]
+) }}
+
+-- Posting activity per channel per day, read by /api/channels/{channel_name}/activity.
+-- Incremental runs recount only the channel-days that received new or changed messages.
+
+with messages as (
+    select * from {{ ref('fct_messages') }}
+    {% if is_incremental() %}
+    where (channel_key, date_key) in (
+        select distinct channel_key, date_key
+        from {{ ref('fct_messages') }}
+        where loaded_at > {{ incremental_watermark() }}
+    )
+    {% endif %}
+),
+
+dates as (
+    select date_key, full_date from {{ ref('dim_dates') }}
+)
+
+select
+    messages.channel_key,
+    messages.date_key,
+    dates.full_date,
+    cast(extract(isoyear from dates.full_date) as integer) as iso_year,
+    cast(extract(week from dates.full_date) as integer) as iso_week,
+    count(*) as post_count,
+    count(messages.view_count) as viewed_post_count,
+    coalesce(sum(messages.view_count), 0) as total_views,
+    coalesce(sum(messages.forward_count), 0) as total_forwards,
+    max(messages.loaded_at) as loaded_at
+from messages
+join dates on messages.date_key = dates.date_key
+group by 1, 2, 3
@@ -1,3 +1,9 @@
+{{ config(
+    indexes=[
+        {'columns': ['channel_key'], 'unique': True},
+        {'columns': ['channel_name'], 'unique': True}
+    ]
+) }}
 
 with staging as (
     select * from {{ ref('stg_telegram_messages') }}
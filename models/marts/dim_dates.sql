@@ -1,5 +1,11 @@
 
-{{ config(materialized='table') }}
+{{ config(
+    materialized='table',
+    indexes=[
+        {'columns': ['date_key'], 'unique': True},
+        {'columns': ['full_date'], 'unique': True}
+    ]
+) }}
 
 with dates as (
     select distinct cast(message_date as date) as full_date
@@ -0,0 +1,71 @@
+{{ config(
+    materialized='incremental',
+    incremental_strategy='delete+insert',
+    unique_key=['channel_key', 'message_id'],
+    indexes=[
+        {'columns': ['channel_key', 'message_id', 'box_index'], 'unique': True},
+        {'columns': ['date_key', 'channel_key', 'message_id']},
+        {'columns': ['class_name']},
+        {'columns': ['loaded_at']}
+    ],
+    pre_hook="
+        {% if is_incremental() %}
+        -- Images left with no boxes have no rows to delete+insert; clear every re-detected image first
+        delete from {{ this }}
+        where (channel_key, message_id) in (
+            select {{ dbt_utils.generate_surrogate_key(['channel_name']) }}, message_id
+            from {{ ref('stg_yolo_detections') }}
+            where loaded_at > {{ incremental_watermark() }}
+        )
+        {% endif %}
+    ",
+    post_hook="{{ cluster_table('date_key') }}"
+) }}
+
+-- depends_on: {{ ref('stg_yolo_detections') }}
+-- One row per detected box: the grain for per-class queries (e.g. /api/reports/visual-content),
+-- and the source fct_image_detections aggregates. Incremental runs rebuild every box of the
+-- images whose boxes, detection results or message changed.
+
+with boxes as (
+    select
+        *,
+        {{ dbt_utils.generate_surrogate_key(['channel_name']) }} as channel_key
+    from {{ ref('stg_yolo_detection_boxes') }}
+),
+messages as (
+    select * from {{ ref('fct_messages') }}
+)
+{% if is_incremental() %}
+, redetected as (
+    -- Same set the pre_hook cleared
+    select
+        {{ dbt_utils.generate_surrogate_key(['channel_name']) }} as channel_key,
+        message_id
+    from {{ ref('stg_yolo_detections') }}
+    where loaded_at > {{ incremental_watermark() }}
+)
+{% endif %}
+
+select
+    boxes.message_id,
+    messages.channel_key,
+    messages.date_key,
+    boxes.box_index,
+    boxes.class_id,
+    boxes.class_name,
+    boxes.confidence,
+    boxes.x1,
+    boxes.y1,
+    boxes.x2,
+    boxes.y2,
+    greatest(boxes.loaded_at, messages.loaded_at) as loaded_at
+from boxes
+inner join messages
+    on boxes.channel_key = messages.channel_key
+    and boxes.message_id = messages.message_id
+{% if is_incremental() %}
+where boxes.loaded_at > {{ incremental_watermark() }}
+   or messages.loaded_at > {{ incremental_watermark() }}
+   or (boxes.channel_key, boxes.message_id) in (select channel_key, message_id from redetected)
+{% endif %}
@@ -1,18 +1,58 @@
-{{ config(materialized='table') }}
+{{ config(
+    materialized='incremental',
+    incremental_strategy='delete+insert',
+    unique_key=['channel_key', 'message_id'],
+    on_schema_change='append_new_columns',
+    indexes=[
+        {'columns': ['channel_key', 'message_id'], 'unique': True},
+        {'columns': ['image_category']},
+        {'columns': ['loaded_at']}
+    ],
+    post_hook="{{ cluster_table('date_key') }}"
+) }}
+
+-- One row per image. detected_class and confidence_score aggregate the image's rows in
+-- fct_detection_boxes; images with no boxes (nothing detected, or detected before boxes
+-- were kept) fall back to the detector's own summary.
 
 with detections as (
-    select * from {{ ref('stg_yolo_detections') }}
+    select
+        *,
+        {{ dbt_utils.generate_surrogate_key(['channel_name']) }} as channel_key
+    from {{ ref('stg_yolo_detections') }}
 ),
 messages as (
     select * from {{ ref('fct_messages') }}
+),
+boxes as (
+    select
+        channel_key,
+        message_id,
+        string_agg(distinct class_name, ', ' order by class_name) as detected_class,
+        max(confidence) as max_confidence,
+        max(loaded_at) as loaded_at
+    from {{ ref('fct_detection_boxes') }}
+    group by channel_key, message_id
 )
 
 select
     detections.message_id,
     messages.channel_key,
     messages.date_key,
-    detections.detected_class,
-    detections.confidence_score,
-    detections.image_category
+    coalesce(boxes.detected_class, detections.detected_class) as detected_class,
+    coalesce(cast(round(cast(boxes.max_confidence as numeric), 2) as float), detections.confidence_score) as confidence_score,
+    detections.image_category,
+    greatest(detections.loaded_at, messages.loaded_at, boxes.loaded_at) as loaded_at
 from detections
-inner join messages on detections.message_id = messages.message_id
+inner join messages
+    on detections.channel_key = messages.channel_key
+    and detections.message_id = messages.message_id
+left join boxes
+    on detections.channel_key = boxes.channel_key
+    and detections.message_id = boxes.message_id
+{% if is_incremental() %}
+-- New detections or boxes, or older detections whose message only just arrived
+where detections.loaded_at > {{ incremental_watermark() }}
+   or messages.loaded_at > {{ incremental_watermark() }}
+   or boxes.loaded_at > {{ incremental_watermark() }}
+{% endif %}
@@ -1,8 +1,31 @@
 
-{{ config(materialized='table') }}
+{{ config(
+    materialized='incremental',
+    incremental_strategy='delete+insert',
+    unique_key=['channel_key', 'message_id'],
+    on_schema_change='append_new_columns',
+    indexes=[
+        {'columns': ['channel_key', 'message_id'], 'unique': True},
+        {'columns': ['message_date', 'channel_key', 'message_id']},
+        {'columns': ['message_id']},
+        {'columns': ['loaded_at']},
+        {'columns': ['message_date'], 'type': 'brin'},
+        {'columns': ['search_vector'], 'type': 'gin'}
+    ],
+    post_hook="{{ cluster_table('message_date') }}"
+) }}
 
 with staging as (
     select * from {{ ref('stg_telegram_messages') }}
+    {% if is_incremental() %}
+    -- Only messages loaded or changed since the last run (plus the lookback overlap)
+    where loaded_at > {{ incremental_watermark() }}
+    {% if var('raw_lookback_days', none) is not none %}
+    -- raw.telegram_messages is partitioned by month on date: bounding message_date
+    -- lets Postgres skip the older partitions entirely. Leave unset while backfilling.
+      and message_date >= current_date - {{ var('raw_lookback_days') | int }}
+    {% endif %}
+    {% endif %}
 ),
 dim_channels as (
     select * from {{ ref('dim_channels') }}
@@ -15,11 +38,17 @@ select
     staging.message_id,
     dim_channels.channel_key,
     dim_dates.date_key,
+    staging.message_date,
     staging.message_text,
     staging.message_length,
     staging.view_count,
     staging.forward_count,
-    staging.has_media
+    staging.has_media,
+    -- Full-text index for /api/search/messages. The 'simple' configuration only
+    -- lowercases, so Amharic and English tokens are indexed alike (no stemming);
+    -- the API must query with the same configuration.
+    to_tsvector('simple', coalesce(staging.message_text, '')) as search_vector,
+    staging.loaded_at
 from staging
 left join dim_channels on staging.channel_name = dim_channels.channel_name
 left join dim_dates on cast(staging.message_date as date) = dim_dates.full_date
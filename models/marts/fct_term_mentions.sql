@@ -0,0 +1,53 @@
+{{ config(
+    materialized='incremental',
+    incremental_strategy='delete+insert',
+    -- Whole channel-days are replaced, so terms an edited message no longer contains are dropped
+    unique_key=['channel_key', 'date_key'],
+    indexes=[
+        {'columns': ['channel_key', 'date_key', 'term'], 'unique': True},
+        {'columns': ['term']},
+        {'columns': ['date_key']}
+    ]
+) }}
+
+-- Term mention counts per channel per day, read by /api/reports/top-products.
+-- Incremental runs recount only the channel-days that received new or changed messages.
+
+with messages as (
+    select * from {{ ref('fct_messages') }}
+    {% if is_incremental() %}
+    where (channel_key, date_key) in (
+        select distinct channel_key, date_key
+        from {{ ref('fct_messages') }}
+        where loaded_at > {{ incremental_watermark() }}
+    )
+    {% endif %}
+),
+
+tokens as (
+    -- English/Latin tokens start with a letter and are at least 3 characters;
+    -- Amharic tokens are runs of Ethiopic syllables (U+1200-U+135A)
+    select
+        channel_key,
+        date_key,
+        loaded_at,
+        (regexp_matches(lower(message_text), '[a-z][a-z0-9]{2,}|[ሀ-ፚ]{2,}', 'g'))[1] as term
+    from messages
+    where message_text is not null and message_text != ''
+),
+
+stopwords as (
+    select term from {{ ref('stopwords') }}
+)
+
+select
+    tokens.channel_key,
+    tokens.date_key,
+    tokens.term,
+    case when tokens.term ~ '^[a-z]' then 'en' else 'am' end as language,
+    count(*) as mention_count,
+    max(tokens.loaded_at) as loaded_at
+from tokens
+left join stopwords on tokens.term = stopwords.term
+where stopwords.term is null
+group by 1, 2, 3
@@ -13,7 +13,8 @@ flattened as (
         cast(message_data->>'forwards' as integer) as forward_count,
         cast(message_data->>'message_text' as text) as message_text,
         cast(message_data->>'has_media' as boolean) as has_media,
-        message_data->>'image_path' as image_path
+        message_data->>'image_path' as image_path,
+        loaded_at
     from raw_data
 )
 
@@ -0,0 +1,21 @@
+with raw_boxes as (
+    -- One row per detected box, loaded by scripts/load_detections.py
+    select * from {{ source('raw', 'yolo_detection_boxes') }}
+)
+
+select
+    cast(message_id as bigint) as message_id,
+    -- Images are stored as data/raw/images/<channel_name>/<message_id>.jpg
+    substring(image_path from '([^/]+)/[^/]+$') as channel_name,
+    image_path,
+    box_index,
+    class_id,
+    class_name,
+    confidence,
+    -- Normalized to [0, 1] of the image width/height
+    x1,
+    y1,
+    x2,
+    y2,
+    loaded_at
+from raw_boxes
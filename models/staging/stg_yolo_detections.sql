@@ -5,8 +5,11 @@ with raw_detections as (
 
 select
     cast(message_id as bigint) as message_id,
+    -- Images are stored as data/raw/images/<channel_name>/<message_id>.jpg
+    substring(image_path from '([^/]+)/[^/]+$') as channel_name,
     image_path,
     detected_class,
     cast(confidence_score as float) as confidence_score,
-    image_category
+    image_category,
+    loaded_at
 from raw_detections
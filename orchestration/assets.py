@@ -1,66 +1,240 @@
 import os
+import time
+import shutil
+import asyncio
 import subprocess
-from dagster import asset, AssetExecutionContext
-from loguru import logger
+from datetime import date
+from dagster import (
+    asset, AssetExecutionContext, Backoff, BackfillPolicy, Config, DailyPartitionsDefinition, MaterializeResult,
+    MetadataValue, MultiPartitionsDefinition, RetryPolicy, StaticPartitionsDefinition
+)
 
-@asset(group_name="extraction")
-def telegram_messages(context: AssetExecutionContext):
+from src import scraper, yolo_detect
+from scripts import load_to_postgres, load_detections, bump_data_version
+from .resources import TelegramClientResource, PostgresResource, YoloModelResource, dagster_log_sink
+
+# Scrape, detect and load run per (day, channel) slice, so a failure or a
+# backfill only touches its own slices. Days are UTC; dbt_marts stays unpartitioned.
+PIPELINE_START_DATE = os.getenv("PIPELINE_START_DATE", "2024-01-01")
+channel_day_partitions = MultiPartitionsDefinition({
+    "date": DailyPartitionsDefinition(start_date=PIPELINE_START_DATE),
+    "channel": StaticPartitionsDefinition(scraper.CHANNELS)
+})
+
+# Artifacts of the last successful dbt build, used to select only changed models
+DBT_STATE_DIR = "target/last_successful_run"
+
+class DbtBuildConfig(Config):
+    # "changed": only models whose sources received new data or whose code changed
+    # since the last successful build; "all": every model
+    selection: str = "changed"
+    full_refresh: bool = False
+
+def timed(fn, *args, **kwargs):
+    started = time.monotonic()
+    result = fn(*args, **kwargs)
+    return result, round(time.monotonic() - started, 2)
+
+def run_streaming(context: AssetExecutionContext, command):
+    """Runs a CLI command, forwarding its output to the Dagster log line by line."""
+    context.log.info(f"Running {' '.join(command)}...")
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    for line in process.stdout:
+        if line.strip():
+            context.log.info(line.rstrip())
+    return process.wait()
+
+def partition_slice(context: AssetExecutionContext):
+    """The (day, channel) a run of the channel-day assets covers."""
+    keys = context.partition_key.keys_by_dimension
+    return date.fromisoformat(keys["date"]), keys["channel"]
+
+def partition_slices(context: AssetExecutionContext):
     """
-    Scrapes messages and images from Telegram channels.
+    The (day, channel) slices a run covers: one, or a range of a day's channels
+    when the detection stage is batched (see sensors.scraped_day_sensor).
     """
-    context.log.info("Starting Telegram scraping...")
-    result = subprocess.run(["python", "src/scraper.py"], capture_output=True, text=True)
-    if result.returncode != 0:
-        raise Exception(f"Scraper failed: {result.stderr}")
-    context.log.info(result.stdout)
-    return "data/raw/telegram_messages"
-
-@asset(deps=[telegram_messages], group_name="enrichment")
-def yolo_detections(context: AssetExecutionContext):
+    slices = []
+    for partition_key in context.partition_keys:
+        keys = channel_day_partitions.get_partition_key_from_str(partition_key).keys_by_dimension
+        slices.append((date.fromisoformat(keys["date"]), keys["channel"]))
+    return slices
+
+def message_file(day, channel_name):
+    return scraper.partition_output_prefix(day, channel_name) + scraper.OUTPUT_EXTENSIONS[scraper.OUTPUT_COMPRESSION]
+
+@asset(
+    partitions_def=channel_day_partitions,
+    group_name="extraction",
+    # FloodWaits and dropped connections only cost a retry of this slice
+    retry_policy=RetryPolicy(max_retries=3, delay=60, backoff=Backoff.EXPONENTIAL)
+)
+def telegram_messages(context: AssetExecutionContext, telegram: TelegramClientResource) -> MaterializeResult:
     """
-    Performs object detection on scraped images using YOLOv8.
+    Scrapes one channel's messages and images for one day.
     """
-    context.log.info("Starting YOLO detection...")
-    result = subprocess.run(["python", "src/yolo_detect.py"], capture_output=True, text=True)
-    if result.returncode != 0:
-        raise Exception(f"YOLO detection failed: {result.stderr}")
-    context.log.info(result.stdout)
-    return "data/raw/yolo_detections.csv"
-
-@asset(deps=[telegram_messages], group_name="ingestion")
-def postgres_raw_messages(context: AssetExecutionContext):
+    day, channel_name = partition_slice(context)
+
+    async def scrape():
+        return await scraper.scrape_partition(day, channel_name, client=telegram.create_client(), phone=telegram.phone)
+
+    with dagster_log_sink(context):
+        (count, path), duration = timed(asyncio.run, scrape())
+    return MaterializeResult(metadata={
+        "path": MetadataValue.path(path),
+        "messages": MetadataValue.int(count),
+        "duration_seconds": MetadataValue.float(duration)
+    })
+
+@asset(
+    partitions_def=channel_day_partitions,
+    deps=[telegram_messages],
+    group_name="enrichment",
+    # A backfill runs each day's channels together, so the model loads once per day
+    backfill_policy=BackfillPolicy.single_run()
+)
+def yolo_detections(context: AssetExecutionContext, yolo: YoloModelResource) -> MaterializeResult:
     """
-    Loads raw telegram JSON data into PostgreSQL raw schema.
+    Performs object detection on the images of one or more channel-days using YOLOv8.
     """
-    context.log.info("Loading messages to Postgres...")
-    result = subprocess.run(["python", "scripts/load_to_postgres.py"], capture_output=True, text=True)
-    if result.returncode != 0:
-        raise Exception(f"Postgres loading failed: {result.stderr}")
-    context.log.info(result.stdout)
-    return "raw.telegram_messages"
-
-@asset(deps=[yolo_detections], group_name="ingestion")
-def postgres_yolo_detections(context: AssetExecutionContext):
+    def detect_slices():
+        totals = dict.fromkeys(["images", "cached", "inferred", "deduplicated", "boxes"], 0)
+        paths = []
+        for day, channel_name in partition_slices(context):
+            images = [
+                (channel_name, msg["message_id"], msg["image_path"])
+                for msg in load_to_postgres.iter_messages(message_file(day, channel_name))
+                if msg.get("image_path") and os.path.exists(msg["image_path"])
+            ]
+            # Loaded by the first slice with images, then shared by the rest of the run
+            model = yolo.get_model() if images else None
+            stats = yolo_detect.run_detection(
+                workers=1, backend=yolo.backend, model=model, images=images,
+                output_file=yolo_detect.partition_output_file(day, channel_name)
+            )
+            if stats is None:
+                raise Exception(f"YOLO detection failed for {channel_name} on {day}, see the log above")
+            for key in totals:
+                totals[key] += stats[key]
+            paths.append(stats["output_file"])
+        return totals, paths
+
+    with dagster_log_sink(context):
+        (stats, paths), duration = timed(detect_slices)
+    return MaterializeResult(metadata={
+        "paths": MetadataValue.json(paths),
+        "images": MetadataValue.int(stats["images"]),
+        "cached": MetadataValue.int(stats["cached"]),
+        "inferred": MetadataValue.int(stats["inferred"]),
+        "deduplicated": MetadataValue.int(stats["deduplicated"]),
+        "boxes": MetadataValue.int(stats["boxes"]),
+        "duration_seconds": MetadataValue.float(duration)
+    })
+
+@asset(
+    partitions_def=channel_day_partitions,
+    deps=[telegram_messages],
+    group_name="ingestion",
+    retry_policy=RetryPolicy(max_retries=2, delay=30)
+)
+def postgres_raw_messages(context: AssetExecutionContext, postgres: PostgresResource) -> MaterializeResult:
+    """
+    Loads one channel-day of raw telegram messages into PostgreSQL raw schema.
     """
-    Loads YOLO detection CSV results into PostgreSQL raw schema.
+    day, channel_name = partition_slice(context)
+    with dagster_log_sink(context), postgres.connection() as conn:
+        # Concurrent slices would queue on each other's VACUUM; autovacuum covers them
+        stats, duration = timed(
+            load_to_postgres.load_messages,
+            conn, retention_months=0, vacuum=False, files=[message_file(day, channel_name)]
+        )
+    if stats["failed_files"]:
+        raise Exception(f"Postgres loading failed for {message_file(day, channel_name)}")
+    return MaterializeResult(metadata={
+        "table": "raw.telegram_messages",
+        "rows_merged": MetadataValue.int(stats["messages"]),
+        "partitions_touched": MetadataValue.int(len(stats["months"])),
+        "duration_seconds": MetadataValue.float(duration)
+    })
+
+@asset(
+    partitions_def=channel_day_partitions,
+    deps=[yolo_detections],
+    group_name="ingestion",
+    backfill_policy=BackfillPolicy.single_run()
+)
+def postgres_yolo_detections(context: AssetExecutionContext, postgres: PostgresResource) -> MaterializeResult:
+    """
+    Loads the YOLO detection results of one or more channel-days into PostgreSQL raw schema.
     """
-    context.log.info("Loading YOLO detections to Postgres...")
-    result = subprocess.run(["python", "scripts/load_detections.py"], capture_output=True, text=True)
-    if result.returncode != 0:
-        raise Exception(f"YOLO loading failed: {result.stderr}")
-    context.log.info(result.stdout)
-    return "raw.yolo_detections"
+    def load_slices(conn):
+        totals = dict.fromkeys(["inserted", "updated", "unchanged", "box_images_replaced"], 0)
+        load_detections.create_table(conn)
+        for day, channel_name in partition_slices(context):
+            stats = load_detections.load_detections(conn, input_file=yolo_detect.partition_output_file(day, channel_name))
+            if stats is None:
+                raise Exception(f"YOLO loading failed for {channel_name} on {day}, see the log above")
+            for key in totals:
+                totals[key] += stats[key]
+        return totals
+
+    with dagster_log_sink(context), postgres.connection() as conn:
+        stats, duration = timed(load_slices, conn)
+    return MaterializeResult(metadata={
+        "table": "raw.yolo_detections",
+        "inserted": MetadataValue.int(stats["inserted"]),
+        "updated": MetadataValue.int(stats["updated"]),
+        "unchanged": MetadataValue.int(stats["unchanged"]),
+        "box_images_replaced": MetadataValue.int(stats["box_images_replaced"]),
+        "duration_seconds": MetadataValue.float(duration)
+    })
 
 @asset(deps=[postgres_raw_messages, postgres_yolo_detections], group_name="transformation")
-def dbt_marts(context: AssetExecutionContext):
+def dbt_marts(context: AssetExecutionContext, config: DbtBuildConfig, postgres: PostgresResource) -> MaterializeResult:
     """
     Runs dbt build to transform raw data into star schema marts.
+    The fact models are incremental; with selection="changed" only models
+    downstream of fresher sources or modified code are built.
     """
-    context.log.info("Running dbt build...")
     # Change directory to project root where profiles.yml is or use --profiles-dir
-    result = subprocess.run(["dbt", "build", "--profiles-dir", "."], capture_output=True, text=True)
-    if result.returncode != 0:
-         context.log.error(result.stderr)
-         raise Exception(f"dbt build failed: {result.stderr}")
-    context.log.info(result.stdout)
-    return "public.marts"
+    command = ["dbt", "build", "--profiles-dir", "."]
+    if config.full_refresh:
+        command.append("--full-refresh")
+
+    if config.selection == "changed" and not config.full_refresh:
+        # Records the sources' current max(loaded_at) in target/sources.json for source_status:fresher
+        freshness = subprocess.run(["dbt", "source", "freshness", "--profiles-dir", "."], capture_output=True, text=True)
+        if freshness.returncode != 0:
+            context.log.warning(f"dbt source freshness reported issues: {freshness.stdout}")
+        if os.path.exists(os.path.join(DBT_STATE_DIR, "sources.json")):
+            command += ["--select", "source_status:fresher+ state:modified+", "--state", DBT_STATE_DIR]
+        else:
+            context.log.info("No previous dbt state found, building all models")
+
+    # dbt stays a CLI invocation; its output is streamed rather than buffered
+    returncode, duration = timed(run_streaming, context, command)
+    if returncode != 0:
+        raise Exception(f"dbt build failed with exit code {returncode}")
+
+    # New mart data: invalidate the API's cached responses
+    version = None
+    try:
+        with dagster_log_sink(context), postgres.connection() as conn:
+            version = bump_data_version.bump_data_version(conn)
+    except Exception as e:
+        context.log.warning(f"Could not bump data version: {e}")
+
+    # Snapshot this run's artifacts as the baseline for the next "changed" build
+    os.makedirs(DBT_STATE_DIR, exist_ok=True)
+    for artifact in ("manifest.json", "sources.json"):
+        if os.path.exists(os.path.join("target", artifact)):
+            shutil.copy(os.path.join("target", artifact), os.path.join(DBT_STATE_DIR, artifact))
+
+    metadata = {
+        "schema": "public",
+        "selection": config.selection,
+        "duration_seconds": MetadataValue.float(duration)
+    }
+    if version is not None:
+        metadata["data_version"] = MetadataValue.int(version)
+    return MaterializeResult(metadata=metadata)
@@ -1,18 +1,43 @@
-from dagster import Definitions, load_assets_from_modules, define_asset_job, ScheduleDefinition
+import os
+from datetime import timedelta
+from dagster import (
+    Definitions, EnvVar, MultiPartitionKey, RunRequest, ScheduleDefinition,
+    load_assets_from_modules, schedule
+)
 from . import assets
+from .jobs import scrape_job, detection_job, message_load_job, marts_job
+from .resources import TelegramClientResource, PostgresResource, YoloModelResource
+from .sensors import scraped_slice_sensor, scraped_day_sensor, loaded_day_sensor
 
 all_assets = load_assets_from_modules([assets])
 
-medical_pipeline_job = define_asset_job("medical_pipeline", selection="*")
+@schedule(job=scrape_job, cron_schedule="15 0 * * *", execution_timezone="UTC")
+def daily_scrape_schedule(context):
+    """Shortly after midnight UTC, one scrape per channel for the day that just ended."""
+    day = (context.scheduled_execution_time - timedelta(days=1)).strftime("%Y-%m-%d")
+    for channel in assets.scraper.CHANNELS:
+        yield RunRequest(
+            run_key=f"{day}|{channel}",
+            partition_key=MultiPartitionKey({"date": day, "channel": channel})
+        )
 
-# Run the pipeline daily at midnight
-daily_schedule = ScheduleDefinition(
-    job=medical_pipeline_job,
-    cron_schedule="0 0 * * *",
-)
+# Backstop for days whose slices never all land (loaded_day_sensor waits for every
+# channel); with selection="changed" a rebuild without new data is cheap
+marts_schedule = ScheduleDefinition(job=marts_job, cron_schedule="0 6 * * *", execution_timezone="UTC")
 
 defs = Definitions(
     assets=all_assets,
-    jobs=[medical_pipeline_job],
-    schedules=[daily_schedule]
+    jobs=[scrape_job, detection_job, message_load_job, marts_job],
+    schedules=[daily_scrape_schedule, marts_schedule],
+    sensors=[scraped_slice_sensor, scraped_day_sensor, loaded_day_sensor],
+    resources={
+        "telegram": TelegramClientResource(
+            api_id=EnvVar("TG_API_ID"),
+            api_hash=EnvVar("TG_API_HASH"),
+            phone=os.getenv("TG_PHONE"),
+            session_string=os.getenv("TG_SESSION_STRING")
+        ),
+        "postgres": PostgresResource(),
+        "yolo": YoloModelResource()
+    }
 )
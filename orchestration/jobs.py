@@ -0,0 +1,38 @@
+from dagster import AssetSelection, define_asset_job, in_process_executor
+
+from . import assets
+
+# Each stage is its own job, run per (day, channel) slice and chained by the
+# sensors in sensors.py; detect runs cover a day's channels at once. Steps of a run share one process, so its resources
+# (DB pool, YOLO model) are set up once. The pipeline/stage tag feeds the run
+# coordinator's per-stage limits (dagster_home/dagster.yaml).
+scrape_job = define_asset_job(
+    "scrape",
+    selection=AssetSelection.assets(assets.telegram_messages),
+    partitions_def=assets.channel_day_partitions,
+    executor_def=in_process_executor,
+    tags={"pipeline/stage": "scrape"}
+)
+
+detection_job = define_asset_job(
+    "detect",
+    selection=AssetSelection.assets(assets.yolo_detections, assets.postgres_yolo_detections),
+    partitions_def=assets.channel_day_partitions,
+    executor_def=in_process_executor,
+    tags={"pipeline/stage": "detect"}
+)
+
+message_load_job = define_asset_job(
+    "load_messages",
+    selection=AssetSelection.assets(assets.postgres_raw_messages),
+    partitions_def=assets.channel_day_partitions,
+    executor_def=in_process_executor,
+    tags={"pipeline/stage": "load"}
+)
+
+marts_job = define_asset_job(
+    "marts",
+    selection=AssetSelection.assets(assets.dbt_marts),
+    executor_def=in_process_executor,
+    tags={"pipeline/stage": "transform"}
+)
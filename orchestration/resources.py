@@ -0,0 +1,95 @@
+import os
+from contextlib import contextmanager
+from typing import Optional
+from dagster import ConfigurableResource, InitResourceContext
+from loguru import logger
+from pydantic import PrivateAttr
+
+class TelegramClientResource(ConfigurableResource):
+    """Telegram API credentials; creates the client the scraper runs on."""
+    api_id: str
+    api_hash: str
+    phone: Optional[str] = None
+    session: str = "anon"
+    # Concurrent runs can't share the SQLite session file (it locks); an exported
+    # StringSession lets every run authenticate from memory instead
+    session_string: Optional[str] = None
+
+    def create_client(self):
+        # Call from inside the coroutine that uses it: the client binds to the running loop
+        from telethon import TelegramClient
+        from telethon.sessions import StringSession
+        from src.scraper import FLOOD_SLEEP_THRESHOLD
+        session = StringSession(self.session_string) if self.session_string else self.session
+        return TelegramClient(session, int(self.api_id), self.api_hash, flood_sleep_threshold=FLOOD_SLEEP_THRESHOLD)
+
+class PostgresResource(ConfigurableResource):
+    """psycopg2 connection pool shared by the loader assets of a run."""
+    host: str = os.getenv("POSTGRES_HOST", "localhost")
+    port: str = os.getenv("POSTGRES_PORT", "5432")
+    dbname: str = os.getenv("POSTGRES_DB", "medical_warehouse")
+    user: str = os.getenv("POSTGRES_USER", "postgres")
+    password: str = os.getenv("POSTGRES_PASSWORD", "postgres")
+    max_connections: int = 4
+
+    _pool = PrivateAttr(default=None)
+
+    def setup_for_execution(self, context: InitResourceContext) -> None:
+        from psycopg2.pool import ThreadedConnectionPool
+        self._pool = ThreadedConnectionPool(
+            1, self.max_connections,
+            host=self.host, port=self.port, dbname=self.dbname, user=self.user, password=self.password
+        )
+
+    def teardown_after_execution(self, context: InitResourceContext) -> None:
+        if self._pool is not None:
+            self._pool.closeall()
+
+    @contextmanager
+    def connection(self):
+        conn = self._pool.getconn()
+        try:
+            yield conn
+        finally:
+            # Never hand a connection with an open transaction back to the pool
+            if not conn.closed:
+                conn.rollback()
+            self._pool.putconn(conn)
+
+class YoloModelResource(ConfigurableResource):
+    """
+    The detection model, loaded on first use and kept for the rest of the run,
+    so torch/ultralytics are imported and the weights read only once.
+    """
+    backend: str = os.getenv("YOLO_BACKEND", "torch").lower()
+    num_threads: int = int(os.getenv("YOLO_THREADS_PER_WORKER", "0"))
+
+    _model = PrivateAttr(default=None)
+
+    def get_model(self):
+        if self._model is None:
+            from src.yolo_detect import load_model
+            logger.info(f"Loading {self.backend} detection model...")
+            self._model = load_model(self.backend, self.num_threads)
+        return self._model
+
+@contextmanager
+def dagster_log_sink(context):
+    """Forwards loguru records to the step's Dagster log while they are emitted."""
+    def sink(message):
+        record = message.record
+        level = record["level"].no
+        if level >= 40:
+            context.log.error(record["message"])
+        elif level >= 30:
+            context.log.warning(record["message"])
+        elif level >= 20:
+            context.log.info(record["message"])
+        else:
+            context.log.debug(record["message"])
+
+    handler_id = logger.add(sink, level="INFO", format="{message}")
+    try:
+        yield
+    finally:
+        logger.remove(handler_id)
@@ -0,0 +1,113 @@
+import os
+import time
+from collections import defaultdict
+from dagster import MultiPartitionKey, RunRequest, multi_asset_sensor
+
+from . import assets
+from .jobs import detection_job, marts_job, message_load_job
+
+# Slices are handed on as soon as they land instead of after a whole stage
+# finishes, so scraping (network), detection (CPU/GPU) and loading (DB) of
+# different slices overlap: the pipeline takes about as long as its slowest
+# stage rather than the sum of all three.
+
+# Every run is a fresh process, and a detection run spends several seconds
+# importing torch and loading the model before its first image. Detection is
+# therefore run per day rather than per slice: a day's slices wait until all of
+# its channels are scraped, or until the oldest has waited this long.
+DETECT_BATCH_WAIT_SECONDS = int(os.getenv("PIPELINE_DETECT_BATCH_WAIT", "3600"))
+
+# Run tags that make a run cover a partition range. A range of the channel-day
+# partitions spans both dimensions, so one day's adjacent channels form a range.
+PARTITION_RANGE_START_TAG = "dagster/asset_partition_range_start"
+PARTITION_RANGE_END_TAG = "dagster/asset_partition_range_end"
+
+def channel_ranges(channels):
+    """Groups channels into runs of neighbours in scraper.CHANNELS order, each one partition range."""
+    groups = []
+    previous = None
+    for index in sorted(assets.scraper.CHANNELS.index(channel) for channel in channels):
+        if groups and index == previous + 1:
+            groups[-1].append(assets.scraper.CHANNELS[index])
+        else:
+            groups.append([assets.scraper.CHANNELS[index]])
+        previous = index
+    return groups
+
+@multi_asset_sensor(
+    monitored_assets=[assets.telegram_messages.key],
+    job=message_load_job,
+    minimum_interval_seconds=30
+)
+def scraped_slice_sensor(context):
+    """Starts message loading for every newly scraped slice."""
+    records = context.latest_materialization_records_by_partition(assets.telegram_messages.key)
+    for partition_key, record in records.items():
+        # Keyed on the materialization, so a re-scraped slice is loaded again
+        yield RunRequest(
+            run_key=f"{message_load_job.name}:{partition_key}:{record.storage_id}",
+            partition_key=partition_key
+        )
+        context.advance_cursor({assets.telegram_messages.key: record})
+
+@multi_asset_sensor(
+    monitored_assets=[assets.telegram_messages.key],
+    job=detection_job,
+    minimum_interval_seconds=30
+)
+def scraped_day_sensor(context):
+    """Starts one detection run per day for its newly scraped slices, so the model loads once."""
+    days = defaultdict(dict)
+    for partition_key, record in context.latest_materialization_records_by_partition(assets.telegram_messages.key).items():
+        keys = assets.channel_day_partitions.get_partition_key_from_str(partition_key).keys_by_dimension
+        days[keys["date"]][keys["channel"]] = record
+
+    if not days:
+        return
+    scraped = context.instance.get_materialized_partitions(assets.telegram_messages.key)
+    for day, records in sorted(days.items()):
+        complete = all(MultiPartitionKey({"date": day, "channel": channel}) in scraped for channel in assets.scraper.CHANNELS)
+        waited = time.time() - min(record.timestamp for record in records.values())
+        if not complete and waited < DETECT_BATCH_WAIT_SECONDS:
+            # Left unconsumed, so they are seen again on the next tick
+            context.log.info(f"Waiting for the remaining channels of {day} before detecting")
+            continue
+        for channels in channel_ranges(records):
+            storage_id = max(records[channel].storage_id for channel in channels)
+            # Keyed on the materializations, so re-scraped slices are detected again
+            yield RunRequest(
+                run_key=f"{detection_job.name}:{day}:{channels[0]}..{channels[-1]}:{storage_id}",
+                tags={
+                    PARTITION_RANGE_START_TAG: str(MultiPartitionKey({"date": day, "channel": channels[0]})),
+                    PARTITION_RANGE_END_TAG: str(MultiPartitionKey({"date": day, "channel": channels[-1]}))
+                }
+            )
+        for record in records.values():
+            context.advance_cursor({assets.telegram_messages.key: record})
+
+@multi_asset_sensor(
+    monitored_assets=[assets.postgres_raw_messages.key, assets.postgres_yolo_detections.key],
+    job=marts_job,
+    minimum_interval_seconds=60
+)
+def loaded_day_sensor(context):
+    """Rebuilds the marts once every channel's messages and detections for a day are loaded."""
+    days = {}
+    for asset_key in (assets.postgres_raw_messages.key, assets.postgres_yolo_detections.key):
+        for partition_key, record in context.latest_materialization_records_by_partition(asset_key).items():
+            day = assets.channel_day_partitions.get_partition_key_from_str(partition_key).keys_by_dimension["date"]
+            days[day] = max(days.get(day, 0), record.storage_id)
+            context.advance_cursor({asset_key: record})
+
+    if not days:
+        return
+    loaded = {
+        asset_key: context.instance.get_materialized_partitions(asset_key)
+        for asset_key in (assets.postgres_raw_messages.key, assets.postgres_yolo_detections.key)
+    }
+    for day, storage_id in sorted(days.items()):
+        expected = {MultiPartitionKey({"date": day, "channel": channel}) for channel in assets.scraper.CHANNELS}
+        if all(expected <= materialized for materialized in loaded.values()):
+            yield RunRequest(run_key=f"marts:{day}:{storage_id}")
+        else:
+            context.log.info(f"Waiting for the remaining slices of {day}")
@@ -0,0 +1,61 @@
+import os
+import psycopg2
+from dotenv import load_dotenv
+from loguru import logger
+
+load_dotenv()
+
+# Database Connection
+DB_NAME = os.getenv("POSTGRES_DB", "medical_warehouse")
+DB_USER = os.getenv("POSTGRES_USER", "postgres")
+DB_PASSWORD = os.getenv("POSTGRES_PASSWORD", "postgres")
+DB_HOST = os.getenv("POSTGRES_HOST", "localhost")
+DB_PORT = os.getenv("POSTGRES_PORT", "5432")
+
+def get_db_connection():
+    try:
+        conn = psycopg2.connect(
+            dbname=DB_NAME,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            host=DB_HOST,
+            port=DB_PORT
+        )
+        return conn
+    except Exception as e:
+        logger.error(f"Error connecting to database: {e}")
+        return None
+
+def bump_data_version(conn):
+    """
+    Increments the warehouse data version after the marts are rebuilt. The API
+    includes this version in its cache keys and ETags, so bumping it
+    invalidates every cached response.
+    """
+    cur = conn.cursor()
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS public.data_version (
+        id INT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+        version BIGINT NOT NULL,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    """)
+    cur.execute("""
+    INSERT INTO public.data_version (id, version, updated_at)
+    VALUES (1, 1, now())
+    ON CONFLICT (id) DO UPDATE
+    SET version = public.data_version.version + 1,
+        updated_at = now()
+    RETURNING version;
+    """)
+    version = cur.fetchone()[0]
+    conn.commit()
+    cur.close()
+    logger.success(f"Data version bumped to {version}")
+    return version
+
+if __name__ == "__main__":
+    conn = get_db_connection()
+    if conn:
+        bump_data_version(conn)
+        conn.close()
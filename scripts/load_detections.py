@@ -1,5 +1,7 @@
+import io
 import os
 import csv
+import glob
 import psycopg2
 from dotenv import load_dotenv
 from loguru import logger
@@ -14,6 +16,10 @@ DB_HOST = os.getenv("POSTGRES_HOST", "localhost")
 DB_PORT = os.getenv("POSTGRES_PORT", "5432")
 
 INPUT_FILE = "data/raw/yolo_detections.csv"
+# Parquet copy written by src/yolo_detect.py, one partition per channel
+LAKE_DIR = os.getenv("LAKE_DIR", "data/lake")
+DETECTION_COLUMNS = ["message_id", "image_path", "detected_class", "confidence_score", "image_category"]
+BOX_COLUMNS = ["message_id", "image_path", "box_index", "class_id", "class_name", "confidence", "x1", "y1", "x2", "y2"]
 
 def get_db_connection():
     try:
@@ -32,69 +38,249 @@ def get_db_connection():
 def create_table(conn):
     try:
         cur = conn.cursor()
-        # Drop and recreate raw schema for clean slate in validation
         cur.execute("CREATE SCHEMA IF NOT EXISTS raw;")
         
+        # Kept across runs: new results are merged in by load_detections.
+        # Keyed by image_path (data/raw/images/<channel>/<message_id>.jpg): message
+        # ids are only unique within a channel
         create_query = """
-        DROP TABLE IF EXISTS raw.yolo_detections;
-        CREATE TABLE raw.yolo_detections (
-            message_id BIGINT PRIMARY KEY,
-            image_path TEXT,
+        CREATE TABLE IF NOT EXISTS raw.yolo_detections (
+            message_id BIGINT,
+            image_path TEXT PRIMARY KEY,
             detected_class TEXT,
             confidence_score FLOAT,
             image_category TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
         """
         cur.execute(create_query)
+        # loaded_at drives the incremental dbt models; add it to tables created before it existed
+        cur.execute("ALTER TABLE raw.yolo_detections ADD COLUMN IF NOT EXISTS loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;")
+        cur.execute("CREATE INDEX IF NOT EXISTS yolo_detections_loaded_at_idx ON raw.yolo_detections (loaded_at);")
+        # Tables created when message_id was the key: rekey on image_path
+        cur.execute("""
+        SELECT a.attname
+        FROM pg_constraint c
+        JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = ANY(c.conkey)
+        WHERE c.conrelid = 'raw.yolo_detections'::regclass AND c.contype = 'p';
+        """)
+        if [row[0] for row in cur.fetchall()] != ["image_path"]:
+            cur.execute("ALTER TABLE raw.yolo_detections DROP CONSTRAINT IF EXISTS yolo_detections_pkey;")
+            cur.execute("ALTER TABLE raw.yolo_detections ADD PRIMARY KEY (image_path);")
+            logger.info("Rekeyed raw.yolo_detections on image_path")
+
+        # One row per detected box; REAL (4-byte) confidence and coordinates, which
+        # are normalized to [0, 1] of the image
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS raw.yolo_detection_boxes (
+            message_id BIGINT NOT NULL,
+            image_path TEXT NOT NULL,
+            box_index SMALLINT NOT NULL,
+            class_id SMALLINT NOT NULL,
+            class_name TEXT NOT NULL,
+            confidence REAL NOT NULL,
+            x1 REAL NOT NULL,
+            y1 REAL NOT NULL,
+            x2 REAL NOT NULL,
+            y2 REAL NOT NULL,
+            loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (image_path, box_index)
+        );
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS yolo_detection_boxes_loaded_at_idx ON raw.yolo_detection_boxes (loaded_at);")
         conn.commit()
         cur.close()
-        logger.info("Table 'raw.yolo_detections' refined.")
+        logger.info("Tables 'raw.yolo_detections' and 'raw.yolo_detection_boxes' created/verified.")
     except Exception as e:
         logger.error(f"Error creating table: {e}")
 
-def load_detections(conn):
-    if not os.path.exists(INPUT_FILE):
-        logger.error(f"Input file not found: {INPUT_FILE}")
+def boxes_input_file(input_file):
+    # Written by src/yolo_detect.py next to every results CSV
+    base, ext = os.path.splitext(input_file)
+    return f"{base}_boxes{ext}"
+
+def lake_files(dataset, lake_dir=LAKE_DIR):
+    return sorted(glob.glob(f"{lake_dir}/{dataset}/*/part-*.parquet"))
+
+def read_lake_detections(dataset="yolo_detections", columns=DETECTION_COLUMNS, lake_dir=LAKE_DIR):
+    """
+    Renders the lake's files of `dataset` as CSV in memory, so they take the
+    same COPY path as the CSV file. Columns added to newer files are ignored.
+    """
+    import pyarrow.parquet as pq
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction='ignore')
+    writer.writeheader()
+    for file_path in lake_files(dataset, lake_dir):
+        writer.writerows(pq.read_table(file_path).to_pylist())
+    buffer.seek(0)
+    return buffer
+
+def merge_boxes(cur, source="csv", boxes_file=None):
+    """
+    COPYs the per-box rows into a staging table and replaces the boxes of every
+    image in staging_yolo_detections whose set of boxes changed (including
+    images that no longer have any). Images whose boxes are identical keep their
+    rows and loaded_at. Runs inside load_detections' transaction. Returns the
+    number of images whose boxes were replaced and the boxes written for them.
+    """
+    if source == "lake" and not lake_files("yolo_detection_boxes"):
+        logger.warning("No boxes in the lake, raw.yolo_detection_boxes left as is")
+        return 0, 0
+    if source == "csv" and not os.path.exists(boxes_file):
+        logger.warning(f"Boxes file not found: {boxes_file}, raw.yolo_detection_boxes left as is")
+        return 0, 0
+
+    cur.execute("""
+    CREATE TEMP TABLE staging_yolo_detection_boxes (
+        seq BIGSERIAL,
+        message_id BIGINT,
+        image_path TEXT,
+        box_index SMALLINT,
+        class_id SMALLINT,
+        class_name TEXT,
+        confidence REAL,
+        x1 REAL,
+        y1 REAL,
+        x2 REAL,
+        y2 REAL
+    ) ON COMMIT DROP;
+    """)
+    with (read_lake_detections("yolo_detection_boxes", BOX_COLUMNS) if source == "lake" else open(boxes_file, 'r', encoding='utf-8')) as f:
+        columns = next(csv.reader(f))
+        f.seek(0)
+        cur.copy_expert(
+            f"COPY staging_yolo_detection_boxes ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, HEADER true)",
+            f
+        )
+    # Last row wins for a duplicated box, as for the detections
+    cur.execute("""
+    DELETE FROM staging_yolo_detection_boxes b
+    USING staging_yolo_detection_boxes newer
+    WHERE newer.image_path = b.image_path AND newer.box_index = b.box_index AND newer.seq > b.seq;
+    """)
+
+    # Compare each staged image's boxes with the stored ones as a whole
+    cur.execute("""
+    CREATE TEMP TABLE changed_box_images ON COMMIT DROP AS
+    WITH staged AS (
+        SELECT i.image_path,
+               array_agg(ROW(b.box_index, b.class_id, b.class_name, b.confidence, b.x1, b.y1, b.x2, b.y2)::text ORDER BY b.box_index)
+                   FILTER (WHERE b.box_index IS NOT NULL) AS boxes
+        FROM (SELECT DISTINCT image_path FROM staging_yolo_detections) i
+        LEFT JOIN staging_yolo_detection_boxes b ON b.image_path = i.image_path
+        GROUP BY i.image_path
+    ),
+    stored AS (
+        SELECT b.image_path,
+               array_agg(ROW(b.box_index, b.class_id, b.class_name, b.confidence, b.x1, b.y1, b.x2, b.y2)::text ORDER BY b.box_index) AS boxes
+        FROM raw.yolo_detection_boxes b
+        WHERE b.image_path IN (SELECT image_path FROM staged)
+        GROUP BY b.image_path
+    )
+    SELECT staged.image_path
+    FROM staged
+    LEFT JOIN stored ON stored.image_path = staged.image_path
+    WHERE staged.boxes IS DISTINCT FROM stored.boxes;
+    """)
+    cur.execute("DELETE FROM raw.yolo_detection_boxes WHERE image_path IN (SELECT image_path FROM changed_box_images);")
+    cur.execute("""
+    INSERT INTO raw.yolo_detection_boxes (message_id, image_path, box_index, class_id, class_name, confidence, x1, y1, x2, y2)
+    SELECT b.message_id, b.image_path, b.box_index, b.class_id, b.class_name, b.confidence, b.x1, b.y1, b.x2, b.y2
+    FROM staging_yolo_detection_boxes b
+    JOIN changed_box_images c ON c.image_path = b.image_path;
+    """)
+    boxes = cur.rowcount
+    cur.execute("SELECT count(*) FROM changed_box_images;")
+    return cur.fetchone()[0], boxes
+
+def load_detections(conn, source="csv", input_file=INPUT_FILE, boxes_file=None):
+    """
+    COPYs the detections CSV into a staging table and merges it into
+    raw.yolo_detections with one set-based upsert, then the per-box rows into
+    raw.yolo_detection_boxes (see merge_boxes), in a single transaction so
+    readers never see a missing or half-loaded table. Rows whose values did not
+    change are left untouched. Returns counts of inserted/updated/unchanged rows
+    and of images whose boxes were replaced.
+    """
+    if source == "csv" and not os.path.exists(input_file):
+        logger.error(f"Input file not found: {input_file}")
         return
 
     try:
         cur = conn.cursor()
-        count = 0
+        # seq follows file order, so the last row for a duplicated image_path wins
+        cur.execute("""
+        CREATE TEMP TABLE staging_yolo_detections (
+            seq BIGSERIAL,
+            message_id BIGINT,
+            image_path TEXT,
+            detected_class TEXT,
+            confidence_score FLOAT,
+            image_category TEXT
+        ) ON COMMIT DROP;
+        """)
         
-        with open(INPUT_FILE, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                insert_query = """
-                INSERT INTO raw.yolo_detections (message_id, image_path, detected_class, confidence_score, image_category)
-                VALUES (%s, %s, %s, %s, %s)
-                ON CONFLICT (message_id) DO UPDATE 
-                SET image_path = EXCLUDED.image_path,
-                    detected_class = EXCLUDED.detected_class,
-                    confidence_score = EXCLUDED.confidence_score,
-                    image_category = EXCLUDED.image_category;
-                """
-                
-                cur.execute(insert_query, (
-                    row['message_id'], 
-                    row['image_path'], 
-                    row['detected_class'], 
-                    row['confidence_score'], 
-                    row['image_category']
-                ))
-                count += 1
+        with (read_lake_detections() if source == "lake" else open(input_file, 'r', encoding='utf-8')) as f:
+            columns = next(csv.reader(f))
+            f.seek(0)
+            cur.copy_expert(
+                f"COPY staging_yolo_detections ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, HEADER true)",
+                f
+            )
+
+        cur.execute("SELECT count(DISTINCT image_path) FROM staging_yolo_detections;")
+        staged = cur.fetchone()[0]
+
+        merge_query = """
+        WITH merged AS (
+            INSERT INTO raw.yolo_detections (message_id, image_path, detected_class, confidence_score, image_category)
+            SELECT DISTINCT ON (image_path) message_id, image_path, detected_class, confidence_score, image_category
+            FROM staging_yolo_detections
+            ORDER BY image_path, seq DESC
+            ON CONFLICT (image_path) DO UPDATE 
+            SET message_id = EXCLUDED.message_id,
+                detected_class = EXCLUDED.detected_class,
+                confidence_score = EXCLUDED.confidence_score,
+                image_category = EXCLUDED.image_category,
+                loaded_at = CURRENT_TIMESTAMP
+            WHERE (raw.yolo_detections.message_id, raw.yolo_detections.detected_class,
+                   raw.yolo_detections.confidence_score, raw.yolo_detections.image_category)
+                IS DISTINCT FROM
+                  (EXCLUDED.message_id, EXCLUDED.detected_class,
+                   EXCLUDED.confidence_score, EXCLUDED.image_category)
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM merged;
+        """
+        cur.execute(merge_query)
+        inserted, updated = cur.fetchone()
+        unchanged = staged - inserted - updated
+        box_images, boxes = merge_boxes(cur, source, boxes_file or boxes_input_file(input_file))
             
         conn.commit()
         cur.close()
-        logger.success(f"Successfully loaded {count} detection records from CSV to PostgreSQL.")
+        logger.success(
+            f"Loaded {staged} detection records from {source} to PostgreSQL: "
+            f"{inserted} inserted, {updated} updated, {unchanged} unchanged; "
+            f"boxes replaced for {box_images} images ({boxes} boxes)."
+        )
+        return {"inserted": inserted, "updated": updated, "unchanged": unchanged, "box_images_replaced": box_images}
         
     except Exception as e:
         logger.error(f"Error loading detections: {e}")
+        conn.rollback()
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Load YOLO detections into raw.yolo_detections and raw.yolo_detection_boxes.")
+    parser.add_argument("--source", choices=["csv", "lake"], default="csv", help="The detections CSV or the Parquet lake")
+    args = parser.parse_args()
+
     conn = get_db_connection()
     if conn:
         create_table(conn)
-        load_detections(conn)
+        load_detections(conn, source=args.source)
         conn.close()
 
@@ -1,6 +1,10 @@
+import io
 import os
+import csv
+import gzip
 import json
 import psycopg2
+from datetime import date, datetime
 from dotenv import load_dotenv
 from loguru import logger
 
@@ -13,6 +17,25 @@ DB_PASSWORD = os.getenv("POSTGRES_PASSWORD", "postgres")
 DB_HOST = os.getenv("POSTGRES_HOST", "localhost")
 DB_PORT = os.getenv("POSTGRES_PORT", "5432")
 
+# Scraper output formats: legacy JSON arrays and (optionally compressed) NDJSON
+MESSAGE_FILE_EXTENSIONS = (".json", ".ndjson", ".ndjson.gz", ".ndjson.zst")
+
+# Parquet lake written alongside the raw files by the scraper (src/lake.py)
+LAKE_DIR = os.getenv("LAKE_DIR", "data/lake")
+
+# Records streamed into the staging table per COPY before merging
+COPY_BATCH_SIZE = int(os.getenv("LOADER_BATCH_SIZE", "10000"))
+
+# raw.telegram_messages is partitioned by month. Partitions are created this many
+# months ahead, and on demand for any month a loaded batch falls in.
+PARTITION_PREMAKE_MONTHS = int(os.getenv("LOADER_PARTITION_PREMAKE_MONTHS", "3"))
+# pg_advisory_xact_lock key serializing partition creation between concurrent loads
+PARTITION_LOCK_KEY = 20240101
+# Monthly partitions older than this are dropped after a load (0 keeps everything)
+RETENTION_MONTHS = int(os.getenv("LOADER_RETENTION_MONTHS", "0"))
+# VACUUM ANALYZE the partitions a load wrote to
+VACUUM_AFTER_LOAD = os.getenv("LOADER_VACUUM", "true").lower() == "true"
+
 def get_db_connection():
     try:
         conn = psycopg2.connect(
@@ -27,73 +50,342 @@ def get_db_connection():
         logger.error(f"Error connecting to database: {e}")
         return None
 
+def month_start(day, offset=0):
+    """First day of the month `offset` months after the one containing `day`."""
+    month_index = day.year * 12 + day.month - 1 + offset
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+def partition_name(month):
+    return f"telegram_messages_p{month:%Y_%m}"
+
+def ensure_partitions(cur, first_month, last_month):
+    """
+    Creates the monthly partitions covering [first_month, last_month] that don't
+    exist yet. Concurrent loads (Dagster runs several) would race on the same
+    CREATE ... PARTITION OF, so creation happens under a transaction-level
+    advisory lock; it is only taken when a partition is actually missing, so
+    loads into existing months never wait on each other.
+    """
+    months = []
+    month = month_start(first_month)
+    while month <= last_month:
+        months.append(month)
+        month = month_start(month, 1)
+
+    cur.execute(
+        "SELECT relname FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace WHERE n.nspname = 'raw' AND c.relname = ANY(%s);",
+        ([partition_name(month) for month in months],)
+    )
+    existing = {row[0] for row in cur.fetchall()}
+    missing = [month for month in months if partition_name(month) not in existing]
+    if not missing:
+        return
+
+    # Held until the caller's transaction ends; IF NOT EXISTS then sees partitions a
+    # concurrent load created and committed while we waited
+    cur.execute("SELECT pg_advisory_xact_lock(%s);", (PARTITION_LOCK_KEY,))
+    for month in missing:
+        cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS raw.{partition_name(month)}
+        PARTITION OF raw.telegram_messages
+        FOR VALUES FROM ('{month}') TO ('{month_start(month, 1)}');
+        """)
+
 def create_table(conn):
+    """
+    Creates raw.telegram_messages range-partitioned by month on `date`, plus the
+    partitions for the next PARTITION_PREMAKE_MONTHS months. A table created by
+    an older version of the loader (a plain heap table) is migrated into it.
+    Errors are re-raised after the rollback: a load into a table left
+    unmigrated would only fail later, on its ON CONFLICT target.
+    """
     try:
         cur = conn.cursor()
         # Create schema 'raw' if it doesn't exist
         cur.execute("CREATE SCHEMA IF NOT EXISTS raw;")
-        
-        # Create table with JSONB column
+
+        cur.execute("SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace WHERE n.nspname = 'raw' AND c.relname = 'telegram_messages';")
+        existing = cur.fetchone()
+        legacy = existing is not None and existing[0] == 'r'
+        if legacy:
+            cur.execute("ALTER TABLE raw.telegram_messages RENAME TO telegram_messages_legacy;")
+            # Constraint and index names move with the table; free them for the new one
+            cur.execute("""
+            SELECT conname FROM pg_constraint
+            WHERE conrelid = 'raw.telegram_messages_legacy'::regclass AND contype IN ('p', 'u');
+            """)
+            for (constraint,) in cur.fetchall():
+                cur.execute(f'ALTER TABLE raw.telegram_messages_legacy DROP CONSTRAINT "{constraint}";')
+            cur.execute("DROP INDEX IF EXISTS raw.telegram_messages_date_idx, raw.telegram_messages_loaded_at_idx;")
+            # Tables from before loaded_at existed; their rows count as loaded now
+            cur.execute("ALTER TABLE raw.telegram_messages_legacy ADD COLUMN IF NOT EXISTS loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;")
+
+        # The partition key must be part of every unique constraint. A message's
+        # date never changes, so (channel_name, message_id, date) still identifies it.
         create_table_query = """
         CREATE TABLE IF NOT EXISTS raw.telegram_messages (
-            id SERIAL PRIMARY KEY,
-            message_id BIGINT,
-            channel_name TEXT,
-            date TIMESTAMP,
+            id BIGSERIAL,
+            message_id BIGINT NOT NULL,
+            channel_name TEXT NOT NULL,
+            date TIMESTAMP NOT NULL,
             message_data JSONB,
-            UNIQUE(channel_name, message_id)
-        );
+            loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (channel_name, message_id, date)
+        ) PARTITION BY RANGE (date);
         """
         cur.execute(create_table_query)
+        # Defined on the parent, so every partition gets them
+        cur.execute("CREATE INDEX IF NOT EXISTS telegram_messages_date_idx ON raw.telegram_messages (date);")
+        cur.execute("CREATE INDEX IF NOT EXISTS telegram_messages_loaded_at_idx ON raw.telegram_messages (loaded_at);")
+
+        today = date.today()
+        ensure_partitions(cur, today, month_start(today, PARTITION_PREMAKE_MONTHS))
+
+        if legacy:
+            cur.execute("SELECT min(date), max(date) FROM raw.telegram_messages_legacy WHERE date IS NOT NULL;")
+            first, last = cur.fetchone()
+            if first is not None:
+                ensure_partitions(cur, first.date(), last.date())
+            cur.execute("""
+            INSERT INTO raw.telegram_messages (message_id, channel_name, date, message_data, loaded_at)
+            SELECT message_id, channel_name, date, message_data, loaded_at
+            FROM raw.telegram_messages_legacy
+            WHERE message_id IS NOT NULL AND channel_name IS NOT NULL AND date IS NOT NULL
+            ON CONFLICT DO NOTHING;
+            """)
+            logger.info(f"Migrated {cur.rowcount} messages into the partitioned table.")
+            cur.execute("DROP TABLE raw.telegram_messages_legacy;")
+
         conn.commit()
         cur.close()
         logger.info("Table 'raw.telegram_messages' created/verified.")
     except Exception as e:
         logger.error(f"Error creating table: {e}")
+        conn.rollback()
+        raise
+
+def iter_messages(file_path):
+    """
+    Yields message records from a scraper output file one at a time, so NDJSON
+    files are read in constant memory. A truncated tail (e.g. the scraper crashed
+    mid-write) is logged and skipped instead of failing the whole file.
+    """
+    if file_path.endswith(".json"):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            yield from json.load(f)
+        return
+
+    truncation_errors = (EOFError, OSError)
+    if file_path.endswith(".gz"):
+        f = gzip.open(file_path, 'rt', encoding='utf-8')
+    elif file_path.endswith(".zst"):
+        import zstandard
+        raw = open(file_path, 'rb')
+        reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+        f = io.TextIOWrapper(reader, encoding='utf-8')
+        truncation_errors += (zstandard.ZstdError,)
+    else:
+        f = open(file_path, 'r', encoding='utf-8')
+
+    with f:
+        line_no = 0
+        try:
+            for line_no, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping malformed line {line_no} in {file_path}")
+        except truncation_errors as e:
+            logger.warning(f"Truncated file {file_path} after line {line_no}: {e}")
+
+def iter_lake_messages(file_path):
+    """Yields message records from one Parquet lake file, COPY_BATCH_SIZE rows in memory at a time."""
+    import pyarrow.parquet as pq
+    for batch in pq.ParquetFile(file_path).iter_batches(batch_size=COPY_BATCH_SIZE):
+        for record in batch.to_pylist():
+            # Back to the scraper's JSON shape, so message_data matches either source
+            if isinstance(record.get("date"), datetime):
+                record["date"] = record["date"].isoformat()
+            yield record
+
+def create_staging_table(cur):
+    # Session-local staging table; seq records file order so the last
+    # occurrence of a duplicated message wins the merge
+    cur.execute("""
+    CREATE TEMP TABLE IF NOT EXISTS staging_telegram_messages (
+        seq BIGINT,
+        message_id BIGINT,
+        channel_name TEXT,
+        date TIMESTAMP,
+        message_data JSONB
+    );
+    """)
+
+def copy_batch(cur, rows):
+    """Streams a batch of rows into the staging table with COPY FROM STDIN."""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cur.copy_expert(
+        "COPY staging_telegram_messages (seq, message_id, channel_name, date, message_data) FROM STDIN WITH (FORMAT csv)",
+        buffer
+    )
+
+def merge_staging(cur):
+    """
+    Upserts the staged batch into raw.telegram_messages in one statement and empties
+    staging, first creating any monthly partitions the batch needs. Re-loaded
+    messages that did not change keep their loaded_at, so the incremental dbt
+    models don't reprocess them. Returns the merged count and the months touched.
+    """
+    cur.execute("""
+    SELECT DISTINCT date_trunc('month', date)::date FROM staging_telegram_messages
+    WHERE date IS NOT NULL ORDER BY 1;
+    """)
+    months = [row[0] for row in cur.fetchall()]
+    if months:
+        ensure_partitions(cur, months[0], months[-1])
+
+    cur.execute("""
+    INSERT INTO raw.telegram_messages (message_id, channel_name, date, message_data)
+    SELECT DISTINCT ON (channel_name, message_id) message_id, channel_name, date, message_data
+    FROM staging_telegram_messages
+    WHERE message_id IS NOT NULL AND channel_name IS NOT NULL AND date IS NOT NULL
+    ORDER BY channel_name, message_id, seq DESC
+    ON CONFLICT (channel_name, message_id, date) DO UPDATE 
+    SET message_data = EXCLUDED.message_data,
+        loaded_at = CURRENT_TIMESTAMP
+    WHERE raw.telegram_messages.message_data IS DISTINCT FROM EXCLUDED.message_data;
+    """)
+    merged = cur.rowcount
+    cur.execute("TRUNCATE staging_telegram_messages;")
+    return merged, months
+
+def drop_expired_partitions(conn, retention_months):
+    """Drops the monthly partitions that end before the retention window starts."""
+    cutoff = month_start(date.today(), -retention_months)
+    cur = conn.cursor()
+    cur.execute("""
+    SELECT c.relname FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'raw.telegram_messages'::regclass AND c.relname ~ '^telegram_messages_p[0-9]{4}_[0-9]{2}$'
+    ORDER BY 1;
+    """)
+    dropped = []
+    for (name,) in cur.fetchall():
+        month = datetime.strptime(name[-7:], "%Y_%m").date()
+        if month < cutoff:
+            cur.execute(f"DROP TABLE raw.{name};")
+            dropped.append(name)
+    conn.commit()
+    cur.close()
+    if dropped:
+        logger.info(f"Dropped {len(dropped)} partitions older than {cutoff}: {', '.join(dropped)}")
+    return dropped
+
+def vacuum_partitions(conn, months):
+    """
+    VACUUM ANALYZEs only the partitions a load wrote to, and ANALYZEs the parent:
+    autovacuum never analyzes a partitioned table itself, so its planner
+    statistics would otherwise go stale.
+    """
+    autocommit = conn.autocommit
+    conn.autocommit = True  # VACUUM cannot run inside a transaction
+    try:
+        cur = conn.cursor()
+        for month in sorted(months):
+            cur.execute(f"VACUUM (ANALYZE) raw.{partition_name(month)};")
+        cur.execute("ANALYZE raw.telegram_messages;")
+        cur.close()
+        logger.info(f"Vacuumed {len(months)} partitions of raw.telegram_messages.")
+    finally:
+        conn.autocommit = autocommit
+
+def find_message_files(data_dir, extensions):
+    for root, dirs, files in os.walk(data_dir):
+        for file in sorted(files):
+            # Dot-files are lake/partition files still being written
+            if file.endswith(extensions) and not file.startswith("."):
+                yield os.path.join(root, file)
+
+def load_data(conn, data_dir=None, source="json", files=None):
+    """
+    Loads every message file under data_dir, or just `files` if given. source
+    "json" reads the scraper's JSON/NDJSON files, "lake" the Parquet files of
+    the lake's telegram_messages dataset.
+    """
+    if source == "lake":
+        data_dir = data_dir or f"{LAKE_DIR}/telegram_messages"
+        extensions, read_file = (".parquet",), iter_lake_messages
+    else:
+        data_dir = data_dir or "data/raw/telegram_messages"
+        extensions, read_file = MESSAGE_FILE_EXTENSIONS, iter_messages
 
-def load_data(conn, data_dir="data/raw/telegram_messages"):
     cur = conn.cursor()
     total_loaded = 0
+    loaded_files = 0
+    failed_files = 0
+    touched_months = set()
     
-    # Walk through the directory structure
-    for root, dirs, files in os.walk(data_dir):
-        for file in files:
-            if file.endswith(".json"):
-                file_path = os.path.join(root, file)
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        messages = json.load(f)
-                        
-                    for msg in messages:
-                        # Extract core fields for query optimization, store rest in JSONB
-                        msg_id = msg.get('message_id')
-                        channel = msg.get('channel_name')
-                        res_date = msg.get('date')
-                        
-                        insert_query = """
-                        INSERT INTO raw.telegram_messages (message_id, channel_name, date, message_data)
-                        VALUES (%s, %s, %s, %s)
-                        ON CONFLICT (channel_name, message_id) DO UPDATE 
-                        SET message_data = EXCLUDED.message_data,
-                            date = EXCLUDED.date;
-                        """
-                        
-                        cur.execute(insert_query, (msg_id, channel, res_date, json.dumps(msg)))
-                        
-                    conn.commit()
-                    logger.info(f"Loaded {len(messages)} messages from {file_path}")
-                    total_loaded += len(messages)
-                    
-                except Exception as e:
-                    logger.error(f"Error loading file {file_path}: {e}")
-                    conn.rollback()
-                    
+    for file_path in files if files is not None else find_message_files(data_dir, extensions):
+        try:
+            # Each file loads in one transaction, COPY_BATCH_SIZE records at a time
+            create_staging_table(cur)
+            count = 0
+            file_months = set()
+            rows = []
+            for seq, msg in enumerate(read_file(file_path)):
+                # Extract core fields for query optimization, store rest in JSONB
+                rows.append((seq, msg.get('message_id'), msg.get('channel_name'), msg.get('date'), json.dumps(msg)))
+                if len(rows) >= COPY_BATCH_SIZE:
+                    copy_batch(cur, rows)
+                    merged, months = merge_staging(cur)
+                    count += merged
+                    file_months.update(months)
+                    rows = []
+            if rows:
+                copy_batch(cur, rows)
+                merged, months = merge_staging(cur)
+                count += merged
+                file_months.update(months)
+                
+            conn.commit()
+            touched_months.update(file_months)
+            logger.info(f"Loaded {count} messages from {file_path}")
+            total_loaded += count
+            loaded_files += 1
+            
+        except Exception as e:
+            logger.error(f"Error loading file {file_path}: {e}")
+            conn.rollback()
+            failed_files += 1
+            
     cur.close()
     logger.success(f"Total messages loaded: {total_loaded}")
+    return {"files": loaded_files, "failed_files": failed_files, "messages": total_loaded, "months": touched_months}
+
+def load_messages(conn, source="json", retention_months=RETENTION_MONTHS, vacuum=VACUUM_AFTER_LOAD, files=None):
+    """Full load: table setup, load, retention and vacuum. Returns load_data's stats."""
+    create_table(conn)
+    stats = load_data(conn, source=source, files=files)
+    if retention_months:
+        stats["dropped_partitions"] = len(drop_expired_partitions(conn, retention_months))
+        cutoff = month_start(date.today(), -retention_months)
+        stats["months"] = {month for month in stats["months"] if month >= cutoff}
+    if vacuum and stats["months"]:
+        vacuum_partitions(conn, stats["months"])
+    return stats
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Load scraped messages into raw.telegram_messages.")
+    parser.add_argument("--source", choices=["json", "lake"], default="json", help="Raw JSON/NDJSON files or the Parquet lake")
+    parser.add_argument("--retention-months", type=int, default=RETENTION_MONTHS, help="Drop monthly partitions older than this many months (0 keeps all)")
+    args = parser.parse_args()
+
     conn = get_db_connection()
     if conn:
-        create_table(conn)
-        load_data(conn)
+        load_messages(conn, source=args.source, retention_months=args.retention_months)
         conn.close()
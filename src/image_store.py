@@ -0,0 +1,214 @@
+import os
+import shutil
+import hashlib
+import sqlite3
+import threading
+from dotenv import load_dotenv
+from loguru import logger
+
+load_dotenv()
+
+# Content-addressed image storage: every distinct picture is kept once as
+#   data/raw/images/_store/<sha256>.jpg
+# and data/raw/images/<channel>/<message_id>.jpg are hardlinks into it, so every
+# image_path recorded by the scraper keeps working.
+IMAGE_DIR = "data/raw/images"
+IMAGE_STORE_DIR = os.path.join(IMAGE_DIR, "_store")
+IMAGE_INDEX_FILE = os.getenv("IMAGE_INDEX_FILE", "data/raw/image_index.sqlite")
+DEDUPE_IMAGES = os.getenv("DEDUPE_IMAGES", "true").lower() == "true"
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+# Images whose 64-bit pHashes differ in at most this many bits are the same picture
+# (reposts are usually re-encoded, so their bytes differ). Lookups split the hash into
+# HASH_BANDS bands and need one band to match exactly, which finds every neighbour
+# as long as the distance stays below HASH_BANDS.
+PHASH_MAX_DISTANCE = int(os.getenv("IMAGE_PHASH_MAX_DISTANCE", "3"))
+HASH_BANDS = 4
+
+def file_sha256(file_path):
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def phash(img_path):
+    """
+    64-bit DCT perceptual hash: stable under re-encoding, resizing and small
+    edits such as a watermark. Returns None if the image can't be decoded.
+    """
+    import cv2
+    import numpy as np
+    img = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        return None
+    small = cv2.resize(img, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    # Median without the DC term, which only encodes overall brightness
+    bits = low > np.median(low[1:])
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+def hash_bands(image_hash):
+    width = 64 // HASH_BANDS
+    return [(image_hash >> (width * i)) & ((1 << width) - 1) for i in range(HASH_BANDS)]
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+class ImageStore:
+    """
+    Stores downloaded images by content and keeps a SQLite index mapping each
+    image_path to a canonical picture: its own content, or the first stored
+    image within PHASH_MAX_DISTANCE of it. Near-duplicates are linked to the
+    canonical file rather than stored again, and detection runs once per
+    canonical picture (see yolo_detect.run_detection).
+    Thread-safe, so the scraper can hash on worker threads; several processes
+    may share the index file.
+    """
+    def __init__(self, path=IMAGE_INDEX_FILE, store_dir=IMAGE_STORE_DIR):
+        if PHASH_MAX_DISTANCE >= HASH_BANDS:
+            logger.warning(f"IMAGE_PHASH_MAX_DISTANCE={PHASH_MAX_DISTANCE} >= {HASH_BANDS} bands: some near-duplicates will be missed")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.store_dir = store_dir
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        band_columns = ", ".join(f"band{i} INTEGER" for i in range(HASH_BANDS))
+        self.conn.executescript(f"""
+        CREATE TABLE IF NOT EXISTS contents (
+            content_hash TEXT PRIMARY KEY,
+            phash TEXT,
+            canonical_hash TEXT NOT NULL,
+            {band_columns}
+        );
+        CREATE TABLE IF NOT EXISTS images (
+            image_path TEXT PRIMARY KEY,
+            content_hash TEXT NOT NULL,
+            canonical_hash TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS images_canonical_idx ON images (canonical_hash);
+        """)
+        for i in range(HASH_BANDS):
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS contents_band{i}_idx ON contents (band{i})")
+        self.conn.commit()
+
+    def store_path(self, content_hash):
+        return os.path.join(self.store_dir, f"{content_hash}.jpg")
+
+    def _nearest(self, image_hash):
+        """Content hash of the closest canonical picture within PHASH_MAX_DISTANCE, or None."""
+        bands = hash_bands(image_hash)
+        where = " OR ".join(f"band{i} = ?" for i in range(HASH_BANDS))
+        rows = self.conn.execute(
+            f"SELECT content_hash, phash FROM contents WHERE content_hash = canonical_hash AND ({where})",
+            bands
+        ).fetchall()
+        candidates = [(hamming(image_hash, int(row[1], 16)), row[0]) for row in rows if row[1]]
+        if not candidates:
+            return None
+        distance, content_hash = min(candidates)
+        return content_hash if distance <= PHASH_MAX_DISTANCE else None
+
+    def _link(self, target, image_path):
+        # Swapped in with a rename, so image_path is never missing or partial
+        tmp_path = f"{image_path}.link"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        try:
+            os.link(target, tmp_path)
+        except OSError:
+            # Filesystem without hardlinks: fall back to a copy
+            shutil.copyfile(target, tmp_path)
+        os.replace(tmp_path, image_path)
+
+    def add(self, src_path, image_path):
+        """
+        Takes the downloaded file at `src_path` (moved into the store, or
+        deleted if the picture is already there) and makes `image_path` a link
+        to the canonical copy. Returns the canonical content hash.
+        """
+        # Hashing reads and decodes the file: done before taking the lock
+        content_hash = file_sha256(src_path)
+        image_hash = phash(src_path)
+
+        with self._lock:
+            row = self.conn.execute("SELECT canonical_hash FROM contents WHERE content_hash = ?", (content_hash,)).fetchone()
+            if row:
+                canonical_hash = row[0]
+            else:
+                canonical_hash = (self._nearest(image_hash) if image_hash is not None else None) or content_hash
+                self.conn.execute(
+                    f"INSERT OR IGNORE INTO contents VALUES (?, ?, ?, {', '.join('?' * HASH_BANDS)})",
+                    [content_hash, f"{image_hash:016x}" if image_hash is not None else None, canonical_hash]
+                    + (hash_bands(image_hash) if image_hash is not None else [None] * HASH_BANDS)
+                )
+
+            target = self.store_path(canonical_hash)
+            if not os.path.exists(target):
+                # First copy of this picture (or its canonical file went missing)
+                target = self.store_path(content_hash)
+            if os.path.exists(target):
+                os.remove(src_path)
+            else:
+                os.makedirs(self.store_dir, exist_ok=True)
+                os.replace(src_path, target)
+            self._link(target, image_path)
+
+            self.conn.execute(
+                "INSERT OR REPLACE INTO images (image_path, content_hash, canonical_hash) VALUES (?, ?, ?)",
+                (image_path, content_hash, canonical_hash)
+            )
+            self.conn.commit()
+        return canonical_hash
+
+    def canonical(self, image_path):
+        """Canonical content hash of an indexed image_path, None for images stored before the index."""
+        with self._lock:
+            row = self.conn.execute("SELECT canonical_hash FROM images WHERE image_path = ?", (image_path,)).fetchone()
+        return row[0] if row else None
+
+    def stats(self):
+        with self._lock:
+            images, canonical = self.conn.execute("SELECT count(*), count(DISTINCT canonical_hash) FROM images").fetchone()
+            contents = self.conn.execute("SELECT count(*) FROM contents").fetchone()[0]
+        return {"images": images, "contents": contents, "canonical": canonical}
+
+    def close(self):
+        self.conn.close()
+
+def index_existing(store, image_dir=IMAGE_DIR):
+    """
+    Moves images downloaded before the store existed into it, replacing each
+    with a link to its canonical copy. Already indexed paths are skipped.
+    """
+    added = 0
+    for channel_name in sorted(os.listdir(image_dir)):
+        channel_path = os.path.join(image_dir, channel_name)
+        if channel_name.startswith("_") or not os.path.isdir(channel_path):
+            continue
+        for img_file in sorted(os.listdir(channel_path)):
+            img_path = os.path.join(channel_path, img_file)
+            if not img_file.endswith(IMAGE_EXTENSIONS) or store.canonical(img_path) is not None:
+                continue
+            store.add(img_path, img_path)
+            added += 1
+        logger.info(f"Indexed {channel_name}")
+    return added
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Maintain the content-addressed image store and its near-duplicate index.")
+    parser.add_argument("--index", action="store_true", help="Move images scraped before the store existed into it")
+    parser.add_argument("--stats", action="store_true", help="Print how many images map to how many distinct pictures")
+    args = parser.parse_args()
+
+    store = ImageStore()
+    try:
+        if args.index:
+            logger.success(f"Indexed {index_existing(store)} images")
+        if args.stats or args.index:
+            stats = store.stats()
+            logger.info(f"{stats['images']} images: {stats['contents']} distinct files, {stats['canonical']} distinct pictures")
+        else:
+            parser.print_help()
+    finally:
+        store.close()
@@ -0,0 +1,245 @@
+import os
+import glob
+import time
+import uuid
+from datetime import datetime
+from dotenv import load_dotenv
+from loguru import logger
+
+load_dotenv()
+
+# Columnar copy of the raw layer, queryable without Postgres (e.g. DuckDB, see Readme):
+#   data/lake/telegram_messages/message_date=YYYY-MM-DD/channel=<name>/part-*.parquet
+#   data/lake/yolo_detections/channel=<name>/part-*.parquet
+#   data/lake/yolo_detection_boxes/channel=<name>/part-*.parquet
+LAKE_DIR = os.getenv("LAKE_DIR", "data/lake")
+WRITE_LAKE = os.getenv("WRITE_LAKE", "true").lower() == "true"
+# Compaction merges a partition's small files into files of up to this many rows
+TARGET_FILE_ROWS = int(os.getenv("LAKE_TARGET_FILE_ROWS", "1000000"))
+PARQUET_COMPRESSION = os.getenv("LAKE_COMPRESSION", "zstd")
+# LakeWriter flushes on its own once it buffers this many records, so memory stays bounded
+FLUSH_ROWS = int(os.getenv("LAKE_FLUSH_ROWS", "10000"))
+
+# Hive partition keys of each dataset, and the key that identifies a record
+DATASETS = {
+    "telegram_messages": {"partitions": ["message_date", "channel"], "key": ["channel_name", "message_id"]},
+    "yolo_detections": {"partitions": ["channel"], "key": ["message_id", "image_path"]},
+    "yolo_detection_boxes": {"partitions": ["channel"], "key": ["image_path", "box_index"]}
+}
+
+def base_schema(dataset):
+    """
+    Known columns and their types. Records may carry extra fields: those are
+    appended with inferred types, and files with different columns are unified
+    when the dataset is read or compacted.
+    """
+    import pyarrow as pa
+    if dataset == "telegram_messages":
+        return pa.schema([
+            ("message_id", pa.int64()),
+            ("channel_name", pa.string()),
+            ("date", pa.timestamp("us", tz="UTC")),
+            ("message_text", pa.string()),
+            ("views", pa.int64()),
+            ("forwards", pa.int64()),
+            ("has_media", pa.bool_()),
+            ("image_path", pa.string())
+        ])
+    if dataset == "yolo_detection_boxes":
+        # Narrow types: boxes outnumber images, and float32 is ample for [0, 1] coordinates
+        # (Parquet dictionary-encodes the repetitive class_name on its own)
+        return pa.schema([
+            ("message_id", pa.int64()),
+            ("image_path", pa.string()),
+            ("box_index", pa.int16()),
+            ("class_id", pa.int16()),
+            ("class_name", pa.string()),
+            ("confidence", pa.float32()),
+            ("x1", pa.float32()),
+            ("y1", pa.float32()),
+            ("x2", pa.float32()),
+            ("y2", pa.float32())
+        ])
+    return pa.schema([
+        ("message_id", pa.int64()),
+        ("image_path", pa.string()),
+        ("detected_class", pa.string()),
+        ("confidence_score", pa.float64()),
+        ("image_category", pa.string())
+    ])
+
+def records_to_table(records, dataset):
+    import pyarrow as pa
+    schema = base_schema(dataset)
+    extra_names = []
+    for record in records:
+        for name in record:
+            if name not in schema.names and name not in extra_names:
+                extra_names.append(name)
+
+    arrays = []
+    for field in schema:
+        values = [record.get(field.name) for record in records]
+        if pa.types.is_timestamp(field.type):
+            # The scraper records dates as ISO-8601 strings
+            values = [datetime.fromisoformat(v) if isinstance(v, str) else v for v in values]
+        arrays.append(pa.array(values, type=field.type))
+    for name in extra_names:
+        arrays.append(pa.array([record.get(name) for record in records]))
+    return pa.Table.from_arrays(arrays, names=schema.names + extra_names)
+
+def partition_dir(dataset, values):
+    parts = [f"{key}={values[key]}" for key in DATASETS[dataset]["partitions"]]
+    return os.path.join(LAKE_DIR, dataset, *parts)
+
+def new_part_name():
+    # Timestamp first, so sorting file names gives write order
+    return f"part-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet"
+
+def write_table(table, directory, name=None):
+    """
+    Writes a Parquet file atomically: readers ignore dot-files, so the temp file
+    is never picked up and the rename publishes it complete.
+    """
+    import pyarrow.parquet as pq
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name or new_part_name())
+    tmp_path = os.path.join(directory, f".{os.path.basename(path)}.tmp")
+    pq.write_table(table, tmp_path, compression=PARQUET_COMPRESSION)
+    os.replace(tmp_path, path)
+    return path
+
+class LakeWriter:
+    """
+    Buffers records and appends them to the dataset as one new Parquet file per
+    partition on every flush(). Flush when the records are committed elsewhere
+    (e.g. before a checkpoint advances); the writer also flushes itself every
+    `flush_rows` records, so a long run never holds everything in memory. Records
+    flushed ahead of a checkpoint that never advances are written again by the
+    next run; compact() and the loaders' upserts absorb the duplicates. Small
+    files are merged by compact().
+    """
+    def __init__(self, dataset, partition_values, flush_rows=FLUSH_ROWS):
+        self.dataset = dataset
+        self.partition_values = partition_values
+        self.flush_rows = flush_rows
+        self._buffer = {}
+        self._pending = 0
+
+    def write(self, record):
+        values = self.partition_values(record)
+        directory = partition_dir(self.dataset, values)
+        self._buffer.setdefault(directory, []).append(record)
+        self._pending += 1
+        if self.flush_rows and self._pending >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        for directory, records in self._buffer.items():
+            write_table(records_to_table(records, self.dataset), directory)
+        self._buffer = {}
+        self._pending = 0
+
+def replace_partitions(dataset, records, partition_values, extra_partitions=()):
+    """
+    Replaces every partition the records fall in with one file holding exactly
+    those records. For datasets rewritten in full each run (detections).
+    `extra_partitions` (partition value dicts) are replaced too, with an empty
+    file if no record falls in them.
+    """
+    by_partition = {partition_dir(dataset, values): [] for values in extra_partitions}
+    for record in records:
+        by_partition.setdefault(partition_dir(dataset, partition_values(record)), []).append(record)
+    for directory, partition_records in by_partition.items():
+        old_files = part_files(directory)
+        path = write_table(records_to_table(partition_records, dataset), directory)
+        for old_file in old_files:
+            if old_file != path:
+                os.remove(old_file)
+    return len(by_partition)
+
+def part_files(directory):
+    return sorted(glob.glob(os.path.join(directory, "part-*.parquet")))
+
+def partition_dirs(dataset):
+    depth = len(DATASETS[dataset]["partitions"])
+    pattern = os.path.join(LAKE_DIR, dataset, *(["*=*"] * depth))
+    return sorted(d for d in glob.glob(pattern) if os.path.isdir(d))
+
+def unified_schema(files):
+    """Union of the files' columns; types are widened where files disagree (e.g. int -> double)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    return pa.unify_schemas([pq.read_schema(f) for f in files], promote_options="permissive")
+
+def read_partition(files):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    tables = [pq.read_table(f) for f in files]
+    return pa.concat_tables(tables, promote_options="permissive")
+
+def dedupe(table, key):
+    """Keeps the last row (in file order) for every key."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    table = table.append_column("__row", pa.array(range(table.num_rows), type=pa.int64()))
+    last = table.group_by(key).aggregate([("__row", "max")])["__row_max"]
+    return table.take(last.take(pc.sort_indices(last))).drop_columns(["__row"])
+
+def compact(dataset, target_rows=TARGET_FILE_ROWS, full=False):
+    """
+    Merges each partition's small files into files of up to `target_rows` rows,
+    unifying their schemas and dropping duplicate records (last write wins).
+    Files already at the target size are left alone, so a record duplicated
+    between one of them and a newer small file survives (readers resolve it by
+    file order, as the loaders do); `full=True` rewrites whole partitions to
+    drop those too.
+    The merged data is published under the name of the newest file it replaces,
+    so it keeps that file's place in write order: a file a scrape writes while
+    compaction runs still sorts after it and wins. It is published before the
+    inputs are removed, so a crash in between leaves duplicates that the next
+    compaction (and the loaders' upserts) absorb, never missing rows.
+    """
+    import pyarrow.parquet as pq
+    key = DATASETS[dataset]["key"]
+    stats = {"partitions": 0, "files_in": 0, "files_out": 0}
+    for directory in partition_dirs(dataset):
+        files = part_files(directory)
+        if not full:
+            # Files already at the target size were compacted before; leave them be
+            files = [f for f in files if pq.ParquetFile(f).metadata.num_rows < target_rows]
+        if len(files) < 2:
+            continue
+        table = dedupe(read_partition(files), key)
+        # part-<ns>-<id>.parquet: chunks before the last get a "-<n>" suffix, which
+        # sorts just before the newest input's own name (and after every older file)
+        newest = os.path.basename(files[-1])
+        chunks = list(range(0, table.num_rows, target_rows)) or [0]
+        names = [newest.replace(".parquet", f"-{i}.parquet") for i in range(len(chunks) - 1)] + [newest]
+        written = [
+            write_table(table.slice(offset, target_rows), directory, name)
+            for offset, name in zip(chunks, names)
+        ]
+        for old_file in files:
+            if old_file not in written:
+                os.remove(old_file)
+        stats["partitions"] += 1
+        stats["files_in"] += len(files)
+        stats["files_out"] += len(written)
+        logger.info(f"Compacted {len(files)} files into {len(written)} in {directory}")
+    return stats
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Maintain the Parquet lake under LAKE_DIR.")
+    parser.add_argument("--compact", action="store_true", help="Merge small files in every partition")
+    parser.add_argument("--full", action="store_true", help="With --compact, also rewrite files already at the target size")
+    parser.add_argument("--dataset", choices=list(DATASETS), action="append", help="Dataset to process (default: all)")
+    args = parser.parse_args()
+
+    if args.compact:
+        for dataset in args.dataset or list(DATASETS):
+            stats = compact(dataset, full=args.full)
+            logger.success(f"{dataset}: compacted {stats['partitions']} partitions ({stats['files_in']} files -> {stats['files_out']})")
+    else:
+        parser.print_help()
@@ -1,12 +1,21 @@
 import os
+import gzip
 import json
 import asyncio
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from telethon import TelegramClient
+from telethon.errors import FloodWaitError
 from telethon.tl.types import MessageMediaPhoto
 from dotenv import load_dotenv
 from loguru import logger
 
+try:
+    from .lake import LakeWriter, replace_partitions, WRITE_LAKE
+    from .image_store import ImageStore, DEDUPE_IMAGES
+except ImportError:  # run as a script: python src/scraper.py
+    from lake import LakeWriter, replace_partitions, WRITE_LAKE
+    from image_store import ImageStore, DEDUPE_IMAGES
+
 # Load environment variables
 load_dotenv()
 
@@ -17,13 +26,32 @@ PHONE = os.getenv('TG_PHONE')
 DATA_DIR = "data/raw"
 LOG_DIR = "logs"
 
-# Ensure directories exist
-os.makedirs(f"{DATA_DIR}/telegram_messages", exist_ok=True)
-os.makedirs(f"{DATA_DIR}/images", exist_ok=True)
-os.makedirs(LOG_DIR, exist_ok=True)
+# Concurrency: how many channels are scraped at the same time, and how many
+# times a channel is retried after Telegram asks us to back off (FloodWait)
+MAX_CONCURRENT_CHANNELS = int(os.getenv("SCRAPER_CONCURRENCY", "5"))
+MAX_FLOOD_RETRIES = int(os.getenv("SCRAPER_FLOOD_RETRIES", "3"))
+# FloodWaits shorter than this are slept through transparently by Telethon
+FLOOD_SLEEP_THRESHOLD = int(os.getenv("SCRAPER_FLOOD_SLEEP_THRESHOLD", "60"))
+
+# Incremental scraping: per-channel checkpoints (high-water marks) live here
+CHECKPOINT_DIR = f"{DATA_DIR}/checkpoints"
+# Messages fetched on the first run of a channel, before it has a checkpoint
+INITIAL_MESSAGE_LIMIT = int(os.getenv("SCRAPER_INITIAL_LIMIT", "100"))
+# Messages requested per page when backfilling history
+BACKFILL_PAGE_SIZE = int(os.getenv("SCRAPER_BACKFILL_PAGE_SIZE", "100"))
 
-# Configure logging
-logger.add(f"{LOG_DIR}/scraper.log", rotation="10 MB", level="INFO")
+# Media downloads run on their own worker coroutines per channel so message
+# iteration never waits on a photo; the queue bound applies backpressure
+DOWNLOAD_WORKERS = int(os.getenv("SCRAPER_DOWNLOAD_WORKERS", "4"))
+DOWNLOAD_QUEUE_SIZE = DOWNLOAD_WORKERS * 10
+# Runs a message whose image failed to download is fetched again before it is given up on
+DOWNLOAD_RETRY_RUNS = int(os.getenv("SCRAPER_DOWNLOAD_RETRY_RUNS", "3"))
+
+# Messages are appended as NDJSON while they stream in: none | gzip | zstd
+OUTPUT_COMPRESSION = os.getenv("SCRAPER_OUTPUT_COMPRESSION", "none").lower()
+OUTPUT_EXTENSIONS = {"none": ".ndjson", "gzip": ".ndjson.gz", "zstd": ".ndjson.zst"}
+# Records written between fsyncs of the output file
+FSYNC_EVERY = int(os.getenv("SCRAPER_FSYNC_EVERY", "100"))
 
 # Channels to scrape
 CHANNELS = [
@@ -34,8 +62,261 @@ CHANNELS = [
     'MohEthiopia'        # Ministry of Health Ethiopia
 ]
 
-async def scrape_channel(client, channel_name):
-    logger.info(f"Starting scrape for channel: {channel_name}")
+def load_checkpoint(channel_name):
+    """
+    Returns the persisted scrape state for a channel:
+    - last_message_id: highest message id already saved (high-water mark)
+    - backfill_offset_id: oldest message id reached by backfill so far
+    - backfill_complete: True once backfill reached the start of the channel
+    - download_failures: {message id: runs its image failed to download}
+    """
+    checkpoint = {"last_message_id": 0, "backfill_offset_id": None, "backfill_complete": False, "download_failures": {}}
+    checkpoint_file = f"{CHECKPOINT_DIR}/{channel_name}.json"
+    if os.path.exists(checkpoint_file):
+        with open(checkpoint_file, 'r', encoding='utf-8') as f:
+            checkpoint.update(json.load(f))
+    return checkpoint
+
+def save_checkpoint(channel_name, checkpoint):
+    # Write to a temp file and rename so a crash never leaves a truncated checkpoint
+    checkpoint_file = f"{CHECKPOINT_DIR}/{channel_name}.json"
+    tmp_file = f"{checkpoint_file}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, indent=4)
+    os.replace(tmp_file, checkpoint_file)
+
+class MessageWriter:
+    """
+    Appends message records to a newline-delimited JSON file as they stream in,
+    optionally gzip/zstd compressed. Every `fsync_every` records the stream is
+    flushed and fsync'ed, so a crash loses at most that many records.
+    Appending to an existing file adds a new gzip member / zstd frame, which
+    the loader reads back transparently. With a LakeWriter, records are also
+    written to the Parquet lake on every sync(), and every LAKE_FLUSH_ROWS
+    records in between.
+    """
+    def __init__(self, path_prefix, compression="none", fsync_every=100, lake=None):
+        self.compression = compression
+        self.lake = lake
+        self.path = path_prefix + OUTPUT_EXTENSIONS[compression]
+        self.fsync_every = fsync_every
+        self.count = 0
+        self._pending = 0
+        self._raw = open(self.path, 'ab')
+        if compression == "gzip":
+            self._stream = gzip.GzipFile(fileobj=self._raw, mode='wb')
+        elif compression == "zstd":
+            import zstandard
+            self._stream = zstandard.ZstdCompressor().stream_writer(self._raw, closefd=False)
+        else:
+            self._stream = self._raw
+
+    def write(self, record):
+        self._stream.write((json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8'))
+        if self.lake is not None:
+            self.lake.write(record)
+        self.count += 1
+        self._pending += 1
+        if self.fsync_every and self._pending >= self.fsync_every:
+            self._fsync()
+
+    def sync(self):
+        """Makes everything written so far durable, including the lake copy; call before advancing a checkpoint."""
+        self._fsync()
+        if self.lake is not None:
+            self.lake.flush()
+
+    def _fsync(self):
+        if self.compression == "zstd":
+            import zstandard
+            self._stream.flush(zstandard.FLUSH_BLOCK)
+        elif self.compression == "gzip":
+            self._stream.flush()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._pending = 0
+
+    def close(self):
+        if self.lake is not None:
+            self.lake.flush()
+        if self._stream is not self._raw:
+            # Ends the gzip member / zstd frame without closing the file itself
+            self._stream.close()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._raw.close()
+
+async def download_image(client, message, image_path, store=None):
+    # Download to a temp file and rename (or link) into place, so a file at
+    # image_path is always complete and the exists() skip check can trust it
+    tmp_path = f"{image_path}.part"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    downloaded = await client.download_media(message, file=tmp_path)
+    if downloaded is None:
+        raise RuntimeError("no media returned")
+    if store is None:
+        os.replace(downloaded, image_path)
+    else:
+        # Hashing decodes the image: keep it off the event loop
+        await asyncio.to_thread(store.add, downloaded, image_path)
+
+async def download_worker(client, download_queue, channel_name, store=None, failed=None):
+    # Ids of messages whose image could not be downloaded are added to `failed`
+    while True:
+        message, image_path = await download_queue.get()
+        try:
+            for attempt in range(1, MAX_FLOOD_RETRIES + 2):
+                try:
+                    logger.info(f"Downloading image for message {message.id} in {channel_name}")
+                    await download_image(client, message, image_path, store)
+                    break
+                except FloodWaitError as e:
+                    if attempt > MAX_FLOOD_RETRIES:
+                        raise
+                    logger.warning(f"FloodWait while downloading in {channel_name}: sleeping {e.seconds}s")
+                    await asyncio.sleep(e.seconds)
+        except Exception as e:
+            logger.warning(f"Failed to download image for message {message.id} in {channel_name}: {e}")
+            if failed is not None:
+                failed.add(message.id)
+        finally:
+            download_queue.task_done()
+
+async def process_message(message, channel_name, image_dir, download_queue):
+    msg_data = {
+        "message_id": message.id,
+        "channel_name": channel_name,
+        "date": message.date.isoformat(),
+        "message_text": message.text,
+        "views": message.views,
+        "forwards": message.forwards,
+        "has_media": False,
+        "image_path": None
+    }
+
+    if message.media and isinstance(message.media, MessageMediaPhoto):
+        msg_data["has_media"] = True
+        image_filename = f"{message.id}.jpg"
+        image_path = os.path.join(image_dir, image_filename)
+        
+        # Check if already downloaded, otherwise hand off to the download workers
+        if not os.path.exists(image_path):
+            await download_queue.put((message, image_path))
+        
+        msg_data["image_path"] = image_path
+
+    return msg_data
+
+def retry_failed_downloads(channel_name, checkpoint, message_ids, failed):
+    """
+    Counts this run's failed image downloads among `message_ids` in the
+    checkpoint and returns the ids to fetch again on the next run. A message
+    is given up on after failing DOWNLOAD_RETRY_RUNS runs, so one image that
+    can never be downloaded doesn't hold the channel back forever.
+    """
+    failures = checkpoint.setdefault("download_failures", {})
+    # Messages fetched again whose image now downloaded
+    for message_id in message_ids:
+        if message_id not in failed:
+            failures.pop(str(message_id), None)
+
+    retry = []
+    for message_id in sorted(failed):
+        attempts = failures.get(str(message_id), 0) + 1
+        if attempts >= DOWNLOAD_RETRY_RUNS:
+            logger.error(f"Giving up on the image of message {message_id} in {channel_name} after {attempts} failed runs")
+            failures.pop(str(message_id), None)
+        else:
+            failures[str(message_id)] = attempts
+            retry.append(message_id)
+    return retry
+
+async def fetch_new_messages(client, entity, channel_name, checkpoint, image_dir, writer, download_queue, failed):
+    """
+    Fetches only messages newer than the channel's high-water mark.
+    Without a checkpoint, the newest INITIAL_MESSAGE_LIMIT messages are fetched.
+    If images failed to download, the mark stays below the oldest of them so
+    the next run fetches those messages again (see retry_failed_downloads).
+    """
+    last_message_id = checkpoint["last_message_id"]
+    if last_message_id:
+        iter_kwargs = {"min_id": last_message_id, "limit": None}
+    else:
+        iter_kwargs = {"limit": INITIAL_MESSAGE_LIMIT}
+
+    message_ids = []
+    async for message in client.iter_messages(entity, **iter_kwargs):
+        writer.write(await process_message(message, channel_name, image_dir, download_queue))
+        message_ids.append(message.id)
+
+    count = len(message_ids)
+    if not count:
+        logger.info(f"No new messages for {channel_name} since message {last_message_id}")
+        return 0
+
+    # Only advance the checkpoint once the messages and their images are safely on disk
+    writer.sync()
+    await download_queue.join()
+
+    retry = retry_failed_downloads(channel_name, checkpoint, message_ids, failed)
+    failed.clear()
+    # min_id is exclusive: holding the mark just below the oldest failure refetches it
+    checkpoint["last_message_id"] = min(retry) - 1 if retry else max(message_ids)
+    if checkpoint["backfill_offset_id"] is None:
+        checkpoint["backfill_offset_id"] = min(message_ids)
+    save_checkpoint(channel_name, checkpoint)
+    if retry:
+        logger.warning(f"{len(retry)} images failed in {channel_name}; holding the checkpoint at message {checkpoint['last_message_id']}")
+    return count
+
+async def backfill_messages(client, entity, channel_name, checkpoint, image_dir, writer, download_queue, failed):
+    """
+    Pages backwards through the channel history with offset_id, BACKFILL_PAGE_SIZE
+    messages at a time. The checkpoint is saved after every page, so a crashed
+    backfill resumes from the last page it wrote. If images of a page failed to
+    download, the backfill stops with its offset just above the newest of them,
+    so the next run fetches those messages again.
+    """
+    if checkpoint["backfill_complete"]:
+        logger.info(f"Backfill already complete for {channel_name}")
+        return 0
+
+    total = 0
+    offset_id = checkpoint["backfill_offset_id"] or 0  # 0 starts from the newest message
+    while True:
+        message_ids = []
+        async for message in client.iter_messages(entity, offset_id=offset_id, limit=BACKFILL_PAGE_SIZE):
+            writer.write(await process_message(message, channel_name, image_dir, download_queue))
+            message_ids.append(message.id)
+
+        if not message_ids:
+            checkpoint["backfill_complete"] = True
+            save_checkpoint(channel_name, checkpoint)
+            logger.info(f"Backfill reached the start of {channel_name}")
+            return total
+
+        writer.sync()
+        await download_queue.join()
+        total += len(message_ids)
+
+        retry = retry_failed_downloads(channel_name, checkpoint, message_ids, failed)
+        failed.clear()
+        checkpoint["last_message_id"] = max(checkpoint["last_message_id"], max(message_ids))
+        if retry:
+            # offset_id is exclusive: resume just above the newest failure
+            checkpoint["backfill_offset_id"] = max(retry) + 1
+            save_checkpoint(channel_name, checkpoint)
+            logger.warning(f"{len(retry)} images failed in {channel_name}; backfill will resume from message {max(retry)}")
+            return total
+
+        offset_id = min(message_ids)
+        checkpoint["backfill_offset_id"] = offset_id
+        save_checkpoint(channel_name, checkpoint)
+        logger.info(f"Backfilled {total} messages for {channel_name} (oldest message id: {offset_id})")
+
+async def scrape_channel(client, channel_name, backfill=False):
+    logger.info(f"Starting {'backfill' if backfill else 'scrape'} for channel: {channel_name}")
     
     today_str = datetime.now().strftime('%Y-%m-%d')
     channel_msg_dir = f"{DATA_DIR}/telegram_messages/{today_str}"
@@ -44,65 +325,190 @@ async def scrape_channel(client, channel_name):
     image_dir = f"{DATA_DIR}/images/{channel_name}"
     os.makedirs(image_dir, exist_ok=True)
 
-    messages_data = []
+    # Parquet copy partitioned by the message's own (UTC) date, not the scrape date
+    lake = None
+    if WRITE_LAKE:
+        lake = LakeWriter("telegram_messages", lambda record: {"message_date": record["date"][:10], "channel": channel_name})
+    writer = MessageWriter(f"{channel_msg_dir}/{channel_name}", OUTPUT_COMPRESSION, FSYNC_EVERY, lake)
+
+    # Reposted pictures are stored once and linked (see src/image_store.py)
+    store = ImageStore() if DEDUPE_IMAGES else None
+    download_queue = asyncio.Queue(maxsize=DOWNLOAD_QUEUE_SIZE)
+    failed_downloads = set()
+    workers = [
+        asyncio.create_task(download_worker(client, download_queue, channel_name, store, failed_downloads))
+        for _ in range(DOWNLOAD_WORKERS)
+    ]
     
     try:
+        checkpoint = load_checkpoint(channel_name)
+
         # Get entity to ensure we can access the channel
         entity = await client.get_entity(channel_name)
         
-        async for message in client.iter_messages(entity, limit=100): # Limit to 100 for dev/testing, remove or increase for prod
-            msg_data = {
-                "message_id": message.id,
-                "channel_name": channel_name,
-                "date": message.date.isoformat(),
-                "message_text": message.text,
-                "views": message.views,
-                "forwards": message.forwards,
-                "has_media": False,
-                "image_path": None
-            }
-
-            if message.media and isinstance(message.media, MessageMediaPhoto):
-                msg_data["has_media"] = True
-                image_filename = f"{message.id}.jpg"
-                image_path = os.path.join(image_dir, image_filename)
-                
-                # Check if already downloaded
-                if not os.path.exists(image_path):
-                    logger.info(f"Downloading image for message {message.id} in {channel_name}")
-                    await client.download_media(message, file=image_path)
-                
-                msg_data["image_path"] = image_path
-
-            messages_data.append(msg_data)
-
-        # Save to JSON
-        output_file = f"{channel_msg_dir}/{channel_name}.json"
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(messages_data, f, ensure_ascii=False, indent=4)
+        if backfill:
+            count = await backfill_messages(client, entity, channel_name, checkpoint, image_dir, writer, download_queue, failed_downloads)
+        else:
+            count = await fetch_new_messages(client, entity, channel_name, checkpoint, image_dir, writer, download_queue, failed_downloads)
         
-        logger.info(f"Saved {len(messages_data)} messages for {channel_name} to {output_file}")
+        logger.info(f"Saved {count} messages for {channel_name} to {writer.path}")
+        return count
 
+    except FloodWaitError:
+        # Let the caller decide how to back off
+        raise
     except Exception as e:
         logger.error(f"Error scraping {channel_name}: {e}")
+    finally:
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        writer.close()
+        if store is not None:
+            store.close()
 
-async def main():
-    if not API_ID or not API_HASH:
-        logger.error("API_ID and API_HASH must be set in .env file")
-        return
+def partition_output_prefix(day, channel_name):
+    # Kept apart from the incremental <date>/<channel> files, which hold whatever a scrape on that date fetched
+    return f"{DATA_DIR}/telegram_messages/{day:%Y-%m-%d}/partitions/{channel_name}"
+
+async def scrape_channel_day(client, channel_name, day):
+    """
+    Scrapes exactly the messages `channel_name` posted on `day` (UTC) into the
+    slice's own file, replacing any earlier attempt, so a (day, channel) slice
+    can be retried or backfilled on its own. Checkpoints are not touched, and
+    errors (including FloodWait) propagate so the orchestrator can retry; so
+    does a failed image download, which leaves the slice unpublished.
+    Returns the number of messages saved and the file path.
+    """
+    day_start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+    day_end = day_start + timedelta(days=1)
+    output_prefix = partition_output_prefix(day, channel_name)
+    os.makedirs(os.path.dirname(output_prefix), exist_ok=True)
+    image_dir = f"{DATA_DIR}/images/{channel_name}"
+    os.makedirs(image_dir, exist_ok=True)
 
-    client = TelegramClient('anon', API_ID, API_HASH)
+    # Written under a dot-name (skipped by the loader) and renamed when complete
+    tmp_prefix = os.path.join(os.path.dirname(output_prefix), f".{channel_name}")
+    tmp_path = tmp_prefix + OUTPUT_EXTENSIONS[OUTPUT_COMPRESSION]
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    writer = MessageWriter(tmp_prefix, OUTPUT_COMPRESSION, FSYNC_EVERY)
+
+    # Reposted pictures are stored once and linked (see src/image_store.py)
+    store = ImageStore() if DEDUPE_IMAGES else None
+    download_queue = asyncio.Queue(maxsize=DOWNLOAD_QUEUE_SIZE)
+    failed_downloads = set()
+    workers = [
+        asyncio.create_task(download_worker(client, download_queue, channel_name, store, failed_downloads))
+        for _ in range(DOWNLOAD_WORKERS)
+    ]
+    records = []
+    try:
+        entity = await client.get_entity(channel_name)
+        # offset_date yields messages sent before it, newest first
+        async for message in client.iter_messages(entity, offset_date=day_end):
+            if message.date < day_start:
+                break
+            record = await process_message(message, channel_name, image_dir, download_queue)
+            writer.write(record)
+            records.append(record)
+        await download_queue.join()
+        if failed_downloads:
+            # Images already downloaded are skipped when the slice is scraped again
+            raise RuntimeError(
+                f"Failed to download {len(failed_downloads)} images for {channel_name} on {day:%Y-%m-%d}: "
+                f"messages {sorted(failed_downloads)}"
+            )
+    finally:
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        writer.close()
+        if store is not None:
+            store.close()
+
+    output_path = output_prefix + OUTPUT_EXTENSIONS[OUTPUT_COMPRESSION]
+    os.replace(tmp_path, output_path)
+    if WRITE_LAKE and records:
+        # The slice is complete, so its lake partition is replaced rather than appended to
+        replace_partitions("telegram_messages", records, lambda record: {"message_date": f"{day:%Y-%m-%d}", "channel": channel_name})
+    logger.info(f"Saved {len(records)} messages for {channel_name} on {day:%Y-%m-%d} to {output_path}")
+    return len(records), output_path
+
+async def scrape_channel_with_backoff(client, channel_name, semaphore, backfill=False):
+    """
+    Scrapes a channel while holding a slot of the concurrency semaphore.
+    On FloodWait the slot is released, we sleep for the requested time
+    (plus a small exponential margin) and retry up to MAX_FLOOD_RETRIES times.
+    Returns the number of messages saved, or None if the channel failed.
+    """
+    for attempt in range(1, MAX_FLOOD_RETRIES + 2):
+        try:
+            async with semaphore:
+                return await scrape_channel(client, channel_name, backfill=backfill)
+        except FloodWaitError as e:
+            if attempt > MAX_FLOOD_RETRIES:
+                logger.error(f"Giving up on {channel_name} after {MAX_FLOOD_RETRIES} FloodWait retries")
+                return None
+            wait_seconds = e.seconds + 2 ** attempt
+            logger.warning(f"FloodWait on {channel_name}: sleeping {wait_seconds}s (retry {attempt}/{MAX_FLOOD_RETRIES})")
+            await asyncio.sleep(wait_seconds)
+
+def create_client():
+    return TelegramClient('anon', API_ID, API_HASH, flood_sleep_threshold=FLOOD_SLEEP_THRESHOLD)
+
+async def main(backfill=False, client=None, phone=PHONE):
+    """
+    Scrapes every channel in CHANNELS and returns {channel: messages saved},
+    with None for channels that failed. Pass a TelegramClient to reuse an
+    already configured one; it is started here and disconnected afterwards.
+    """
+    os.makedirs(f"{DATA_DIR}/telegram_messages", exist_ok=True)
+    os.makedirs(f"{DATA_DIR}/images", exist_ok=True)
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+
+    if client is None:
+        if not API_ID or not API_HASH:
+            logger.error("API_ID and API_HASH must be set in .env file")
+            return {}
+        client = create_client()
     
-    await client.start(phone=PHONE)
+    await client.start(phone=phone)
     
-    logger.info("Client started. Beginning scrape...")
+    logger.info(f"Client started. Scraping {len(CHANNELS)} channels, {MAX_CONCURRENT_CHANNELS} at a time...")
     
-    for channel in CHANNELS:
-        await scrape_channel(client, channel)
+    try:
+        # Channels share one connection; the semaphore bounds how many are in flight
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_CHANNELS)
+        counts = await asyncio.gather(*(scrape_channel_with_backoff(client, channel, semaphore, backfill=backfill) for channel in CHANNELS))
+    finally:
+        await client.disconnect()
         
     logger.info("Scraping completed.")
-    await client.disconnect()
+    return dict(zip(CHANNELS, counts))
+
+async def scrape_partition(day, channel_name, client=None, phone=PHONE):
+    """Runs scrape_channel_day on its own client; see main() for `client`."""
+    client = client or create_client()
+    await client.start(phone=phone)
+    try:
+        return await scrape_channel_day(client, channel_name, day)
+    finally:
+        await client.disconnect()
 
 if __name__ == '__main__':
-    import asyncio
-    asyncio.run(main())
+    import argparse
+    parser = argparse.ArgumentParser(description="Scrape Telegram channels into the raw data lake.")
+    parser.add_argument("--backfill", action="store_true", help="Page backwards through channel history, resuming from the last checkpoint")
+    parser.add_argument("--date", type=lambda value: datetime.strptime(value, "%Y-%m-%d").date(), help="Scrape only this day (UTC) of --channel")
+    parser.add_argument("--channel", help="With --date, the channel to scrape")
+    args = parser.parse_args()
+    if (args.date is None) != (args.channel is None):
+        parser.error("--date and --channel must be given together")
+
+    os.makedirs(LOG_DIR, exist_ok=True)
+    logger.add(f"{LOG_DIR}/scraper.log", rotation="10 MB", level="INFO")
+    if args.date:
+        asyncio.run(scrape_partition(args.date, args.channel))
+    else:
+        asyncio.run(main(backfill=args.backfill))
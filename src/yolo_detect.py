@@ -1,16 +1,59 @@
 import os
+import ast
 import csv
-import torch
-# Safety fix for PyTorch 2.6+ when loading Ultralytics models
-# This allows the unpickling of DetectionModel which is considered "unsafe" by default now
-from ultralytics import YOLO
+import json
+import zlib
+import hashlib
+import sqlite3
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+import cv2
+import numpy as np
 from loguru import logger
 
+try:
+    from .lake import replace_partitions, WRITE_LAKE
+    from .image_store import ImageStore, IMAGE_INDEX_FILE, DEDUPE_IMAGES
+except ImportError:  # run as a script: python src/yolo_detect.py
+    from lake import replace_partitions, WRITE_LAKE
+    from image_store import ImageStore, IMAGE_INDEX_FILE, DEDUPE_IMAGES
+
 # Configuration
 IMAGE_DIR = "data/raw/images"
 OUTPUT_FILE = "data/raw/yolo_detections.csv"
 MODEL_PATH = "yolov8n.pt"
 CONF_THRESHOLD = 0.50
+IOU_THRESHOLD = 0.70  # Ultralytics' default NMS IoU
+IMAGE_SIZE = 640
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+CSV_FIELDS = ["message_id", "image_path", "detected_class", "confidence_score", "image_category"]
+# One row per detected box, written next to each results CSV (see boxes_output_file)
+BOX_CSV_FIELDS = ["message_id", "image_path", "box_index", "class_id", "class_name", "confidence", "x1", "y1", "x2", "y2"]
+# Decimals kept for box confidences and coordinates (1e-4 of the image is sub-pixel at IMAGE_SIZE)
+BOX_PRECISION = 4
+
+# Images sent through the model per forward pass, and threads decoding the next batch
+BATCH_SIZE = int(os.getenv("YOLO_BATCH_SIZE", "16"))
+PREFETCH_WORKERS = int(os.getenv("YOLO_PREFETCH_WORKERS", "4"))
+
+# Detection results cache, keyed by image content, model weights and CONF_THRESHOLD
+CACHE_FILE = os.getenv("YOLO_CACHE_FILE", "data/raw/yolo_cache.sqlite")
+
+# Sharded mode: worker processes (each loads the model once) and the Torch
+# intra-op threads each of them may use (0 = split the CPUs evenly)
+DETECTION_WORKERS = int(os.getenv("YOLO_WORKERS", "1"))
+THREADS_PER_WORKER = int(os.getenv("YOLO_THREADS_PER_WORKER", "0"))
+
+# Inference backend: "torch" (Ultralytics) or "onnx" (ONNX Runtime, no PyTorch import).
+# Create the ONNX model once with `--export-onnx` (optionally `--int8`).
+INFERENCE_BACKEND = os.getenv("YOLO_BACKEND", "torch").lower()
+ONNX_MODEL_PATH = os.getenv("YOLO_ONNX_MODEL", os.path.splitext(MODEL_PATH)[0] + ".onnx")
+# Max allowed confidence difference between backends when verifying an export
+PARITY_TOLERANCE = 0.05
+
+# One detected box; bbox coordinates are normalized to [0, 1] of the original image
+Detection = namedtuple("Detection", ["class_id", "class_name", "confidence", "x1", "y1", "x2", "y2"])
 
 def classify_image(detected_classes):
     """
@@ -34,9 +77,95 @@ def classify_image(detected_classes):
     else:
         return "other"
 
-def run_detection():
-    logger.info("Initializing YOLO model...")
-    try:
+class DetectionCache:
+    """
+    SQLite side store of per-image detection results, keyed by the image content
+    hash, the model weights hash and the confidence threshold, so re-runs only
+    infer new or changed images. A second table remembers each file's hash by
+    (size, mtime) so unchanged files aren't re-read just to be hashed.
+    Each result keeps its boxes as a JSON list of [class_id, class_name,
+    confidence, x1, y1, x2, y2]; entries cached before boxes were kept count
+    as misses, so those images are inferred once more.
+    """
+    def __init__(self, path=CACHE_FILE):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Several shard processes on one machine may share the cache file
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.executescript("""
+        CREATE TABLE IF NOT EXISTS file_hashes (
+            file_path TEXT PRIMARY KEY,
+            size INTEGER,
+            mtime_ns INTEGER,
+            content_hash TEXT
+        );
+        CREATE TABLE IF NOT EXISTS detections (
+            content_hash TEXT,
+            model_hash TEXT,
+            conf_threshold REAL,
+            detected_class TEXT,
+            confidence_score REAL,
+            image_category TEXT,
+            boxes TEXT,
+            PRIMARY KEY (content_hash, model_hash, conf_threshold)
+        );
+        """)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(detections)")]
+        if "boxes" not in columns:
+            self.conn.execute("ALTER TABLE detections ADD COLUMN boxes TEXT")
+
+    def file_hash(self, file_path):
+        stat = os.stat(file_path)
+        row = self.conn.execute(
+            "SELECT content_hash FROM file_hashes WHERE file_path = ? AND size = ? AND mtime_ns = ?",
+            (file_path, stat.st_size, stat.st_mtime_ns)
+        ).fetchone()
+        if row:
+            return row[0]
+
+        sha = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha.update(chunk)
+        content_hash = sha.hexdigest()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO file_hashes (file_path, size, mtime_ns, content_hash) VALUES (?, ?, ?, ?)",
+            (file_path, stat.st_size, stat.st_mtime_ns, content_hash)
+        )
+        return content_hash
+
+    def get(self, content_hash, model_hash, conf_threshold):
+        row = self.conn.execute(
+            "SELECT detected_class, confidence_score, image_category, boxes FROM detections "
+            "WHERE content_hash = ? AND model_hash = ? AND conf_threshold = ?",
+            (content_hash, model_hash, conf_threshold)
+        ).fetchone()
+        if row is None or row[3] is None:
+            return None
+        return {"detected_class": row[0], "confidence_score": row[1], "image_category": row[2], "boxes": json.loads(row[3])}
+
+    def put(self, content_hash, model_hash, conf_threshold, summary):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO detections VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (content_hash, model_hash, conf_threshold,
+             summary["detected_class"], summary["confidence_score"], summary["image_category"],
+             json.dumps(summary["boxes"]))
+        )
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+class TorchDetector:
+    """Runs the Ultralytics PyTorch model and returns Detection lists."""
+    def __init__(self, model_path=MODEL_PATH, num_threads=0):
+        import torch
+        # Safety fix for PyTorch 2.6+ when loading Ultralytics models
+        # This allows the unpickling of DetectionModel which is considered "unsafe" by default now
+        from ultralytics import YOLO
+
         # Workaround for PyTorch 2.6 weights_only issue
         # We manually load it with weights_only=False if the generic way fails
         # but Ultralytics usually handles its own loading. 
@@ -47,75 +176,526 @@ def run_detection():
                 kwargs['weights_only'] = False
             return original_load(*args, **kwargs)
         torch.load = patched_load
-        
-        model = YOLO(MODEL_PATH)
-    except Exception as e:
-        logger.error(f"Failed to load model: {e}")
-        return
 
-    if not os.path.exists(IMAGE_DIR):
-        logger.error(f"Image directory not found: {IMAGE_DIR}")
-        return
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self.model = YOLO(model_path)
+        self.names = self.model.names
 
-    logger.info(f"Scanning images in {IMAGE_DIR}...")
-    
-    results_list = []
-    processed_images = 0
+    def __call__(self, images):
+        results = self.model(images, verbose=False, conf=CONF_THRESHOLD, iou=IOU_THRESHOLD, imgsz=IMAGE_SIZE)
+        return [
+            [
+                Detection(int(cls_id), self.names[int(cls_id)], float(conf), *map(float, xyxyn))
+                for cls_id, conf, xyxyn in zip(res.boxes.cls.tolist(), res.boxes.conf.tolist(), res.boxes.xyxyn.tolist())
+            ]
+            for res in results
+        ]
+
+class OnnxDetector:
+    """
+    Runs an exported YOLOv8 ONNX model on ONNX Runtime (CPU). Pre- and
+    post-processing mirror Ultralytics: letterbox to IMAGE_SIZE, then
+    confidence filtering and class-aware NMS.
+    """
+    def __init__(self, model_path=ONNX_MODEL_PATH, num_threads=0):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        # Ultralytics stores the class names in the exported model's metadata
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata["names"])
+        self.imgsz = ast.literal_eval(metadata.get("imgsz", str([IMAGE_SIZE, IMAGE_SIZE])))
+
+    def _letterbox(self, img):
+        h, w = img.shape[:2]
+        new_h, new_w = self.imgsz
+        ratio = min(new_h / h, new_w / w)
+        unpad_w, unpad_h = round(w * ratio), round(h * ratio)
+        pad_w, pad_h = (new_w - unpad_w) / 2, (new_h - unpad_h) / 2
+        if (unpad_w, unpad_h) != (w, h):
+            img = cv2.resize(img, (unpad_w, unpad_h), interpolation=cv2.INTER_LINEAR)
+        top, bottom = round(pad_h - 0.1), round(pad_h + 0.1)
+        left, right = round(pad_w - 0.1), round(pad_w + 0.1)
+        img = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+        return img, ratio, left, top
+
+    def __call__(self, images):
+        letterboxed = [self._letterbox(img) for img in images]
+        # BGR HWC uint8 -> RGB CHW float32 in [0, 1]
+        blob = np.stack([lb[0][:, :, ::-1].transpose(2, 0, 1) for lb in letterboxed]).astype(np.float32) / 255.0
+        output = self.session.run(None, {self.input_name: blob})[0]  # (N, 4 + num_classes, anchors)
+
+        detections = []
+        for img, (_, ratio, pad_left, pad_top), preds in zip(images, letterboxed, output):
+            preds = preds.T
+            class_scores = preds[:, 4:]
+            class_ids = class_scores.argmax(axis=1)
+            confidences = class_scores[np.arange(len(class_ids)), class_ids]
+            keep = confidences >= CONF_THRESHOLD
+            preds, class_ids, confidences = preds[keep], class_ids[keep], confidences[keep]
 
-    for channel_name in os.listdir(IMAGE_DIR):
-        channel_path = os.path.join(IMAGE_DIR, channel_name)
-        if not os.path.isdir(channel_path):
+            # (cx, cy, w, h) in letterbox space -> (x, y, w, h) in original pixels
+            boxes = preds[:, :4].copy()
+            boxes[:, 0] = (boxes[:, 0] - boxes[:, 2] / 2 - pad_left) / ratio
+            boxes[:, 1] = (boxes[:, 1] - boxes[:, 3] / 2 - pad_top) / ratio
+            boxes[:, 2:] /= ratio
+            indices = cv2.dnn.NMSBoxesBatched(
+                boxes.tolist(), confidences.tolist(), class_ids.tolist(), CONF_THRESHOLD, IOU_THRESHOLD
+            ) if len(boxes) else []
+
+            h, w = img.shape[:2]
+            image_detections = []
+            for i in np.array(indices).flatten()[:300]:
+                x, y, bw, bh = boxes[i]
+                image_detections.append(Detection(
+                    int(class_ids[i]), self.names[int(class_ids[i])], float(confidences[i]),
+                    float(np.clip(x / w, 0, 1)), float(np.clip(y / h, 0, 1)),
+                    float(np.clip((x + bw) / w, 0, 1)), float(np.clip((y + bh) / h, 0, 1))
+                ))
+            image_detections.sort(key=lambda d: d.confidence, reverse=True)
+            detections.append(image_detections)
+        return detections
+
+def model_file(backend=INFERENCE_BACKEND):
+    return ONNX_MODEL_PATH if backend == "onnx" else MODEL_PATH
+
+def load_model(backend=INFERENCE_BACKEND, num_threads=0):
+    logger.info(f"Initializing YOLO model ({backend} backend)...")
+    if backend == "onnx":
+        if not os.path.exists(ONNX_MODEL_PATH):
+            raise FileNotFoundError(f"{ONNX_MODEL_PATH} not found, run with --export-onnx first")
+        return OnnxDetector(ONNX_MODEL_PATH, num_threads)
+    return TorchDetector(MODEL_PATH, num_threads)
+
+def export_onnx(int8=False):
+    """
+    Exports MODEL_PATH to ONNX (dynamic batch) for the onnx backend and,
+    with int8=True, dynamically quantizes the weights to INT8 in place.
+    """
+    detector = TorchDetector(MODEL_PATH)
+    exported = detector.model.export(format="onnx", imgsz=IMAGE_SIZE, dynamic=True, simplify=True)
+    if os.path.abspath(exported) != os.path.abspath(ONNX_MODEL_PATH):
+        os.replace(exported, ONNX_MODEL_PATH)
+
+    if int8:
+        import onnx
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        fp32_path = f"{ONNX_MODEL_PATH}.fp32"
+        os.replace(ONNX_MODEL_PATH, fp32_path)
+        quantize_dynamic(fp32_path, ONNX_MODEL_PATH, weight_type=QuantType.QUInt8)
+        # Keep the class names and image size the detector reads from metadata
+        quantized = onnx.load(ONNX_MODEL_PATH)
+        quantized.metadata_props.extend(onnx.load(fp32_path).metadata_props)
+        onnx.save(quantized, ONNX_MODEL_PATH)
+        os.remove(fp32_path)
+
+    logger.success(f"Exported {'INT8 ' if int8 else ''}ONNX model to {ONNX_MODEL_PATH}")
+
+def _box_iou(a, b):
+    inter_w = max(0.0, min(a.x2, b.x2) - max(a.x1, b.x1))
+    inter_h = max(0.0, min(a.y2, b.y2) - max(a.y1, b.y1))
+    inter = inter_w * inter_h
+    union = (a.x2 - a.x1) * (a.y2 - a.y1) + (b.x2 - b.x1) * (b.y2 - b.y1) - inter
+    return inter / union if union > 0 else 0.0
+
+def verify_onnx(sample_size=50, tolerance=PARITY_TOLERANCE):
+    """
+    Runs a sample of images through both backends and checks that every box
+    has a same-class counterpart (IoU >= 0.5) whose confidence is within
+    `tolerance`. Boxes near CONF_THRESHOLD may legitimately appear on one side
+    only, so those are ignored. Returns True when the backends agree.
+    """
+    images = discover_images()[:sample_size]
+    torch_detector = load_model("torch")
+    onnx_detector = load_model("onnx")
+
+    mismatches = 0
+    for _, _, img_path in images:
+        img = decode_image(img_path)
+        if img is None:
+            continue
+        expected, actual = torch_detector([img])[0], onnx_detector([img])[0]
+        for ours, theirs in ((expected, actual), (actual, expected)):
+            for det in ours:
+                if det.confidence < CONF_THRESHOLD + tolerance:
+                    continue
+                matched = any(
+                    other.class_id == det.class_id
+                    and _box_iou(det, other) >= 0.5
+                    and abs(other.confidence - det.confidence) <= tolerance
+                    for other in theirs
+                )
+                if not matched:
+                    mismatches += 1
+                    logger.warning(f"Backend mismatch in {img_path}: {det.class_name} ({det.confidence:.2f})")
+
+    if mismatches:
+        logger.error(f"ONNX parity check failed: {mismatches} mismatched detections over {len(images)} images")
+        return False
+    logger.success(f"ONNX backend matches PyTorch within {tolerance} on {len(images)} images")
+    return True
+
+def discover_images(image_dir=IMAGE_DIR):
+    """
+    Returns (channel_name, message_id, img_path) for every image under image_dir,
+    sorted so batches and output rows are deterministic between runs.
+    """
+    images = []
+    for channel_name in sorted(os.listdir(image_dir)):
+        channel_path = os.path.join(image_dir, channel_name)
+        # Skips the content-addressed _store, whose files are linked from the channel folders
+        if channel_name.startswith("_") or not os.path.isdir(channel_path):
             continue
             
-        for img_file in os.listdir(channel_path):
-            if not img_file.endswith(('.jpg', '.jpeg', '.png', '.webp')):
+        for img_file in sorted(os.listdir(channel_path)):
+            if not img_file.endswith(IMAGE_EXTENSIONS):
                 continue
                 
             img_path = os.path.join(channel_path, img_file)
             message_id = img_file.split('.')[0]
-            
-            try:
-                # Run inference
-                prediction = model(img_path, verbose=False, conf=CONF_THRESHOLD)
-                
-                detected_classes = []
-                confidences = []
-                
-                for res in prediction:
-                    for box in res.boxes:
-                        cls_name = model.names[int(box.cls[0])]
-                        conf = float(box.conf[0])
-                        detected_classes.append(cls_name)
-                        confidences.append(conf)
-                
-                # Determine category
-                category = classify_image(detected_classes)
-                
-                # Aligning with required columns: message_id, image_path, detected_class, confidence_score, image_category
-                results_list.append({
-                    "message_id": message_id,
-                    "image_path": img_path,
-                    "detected_class": ", ".join(set(detected_classes)) if detected_classes else "none",
-                    "confidence_score": round(max(confidences), 2) if confidences else 0.0,
-                    "image_category": category
-                })
-                        
-                processed_images += 1
+            images.append((channel_name, message_id, img_path))
+    return images
 
+def decode_image(img_path):
+    # cv2 releases the GIL while decoding, so this parallelizes on a thread pool
+    img = cv2.imread(img_path)
+    if img is None:
+        logger.warning(f"Could not decode {img_path}")
+    return img
+
+def summarize_prediction(detections):
+    """
+    Collapses one image's detections into the CSV columns for that image, and
+    keeps the boxes themselves (most confident first) for the per-box output.
+    """
+    detected_classes = [det.class_name for det in detections]
+    confidences = [det.confidence for det in detections]
+    
+    # Aligning with required columns: message_id, image_path, detected_class, confidence_score, image_category
+    return {
+        "detected_class": ", ".join(set(detected_classes)) if detected_classes else "none",
+        "confidence_score": round(max(confidences), 2) if confidences else 0.0,
+        "image_category": classify_image(detected_classes),
+        "boxes": [
+            [det.class_id, det.class_name] + [round(value, BOX_PRECISION) for value in (det.confidence, det.x1, det.y1, det.x2, det.y2)]
+            for det in sorted(detections, key=lambda d: d.confidence, reverse=True)
+        ]
+    }
+
+def infer_batch(model, images):
+    """
+    Runs one batched forward pass over a list of decoded images. If the batch
+    fails, images are retried one by one so a single bad image doesn't sink
+    its neighbours; failed images yield None.
+    """
+    try:
+        return model(images)
+    except Exception as e:
+        logger.warning(f"Batch inference failed ({e}), retrying images individually")
+
+    results = []
+    for img in images:
+        try:
+            results.append(model([img])[0])
+        except Exception as e:
+            logger.warning(f"Error running inference: {e}")
+            results.append(None)
+    return results
+
+def detect_batches(model, entries, batch_size=BATCH_SIZE):
+    """
+    Runs batched inference over entries (tuples whose third item is the image
+    path) and yields, per batch, a list of (entry, summary) pairs. The next batch
+    is decoded on a prefetch pool while the current one is inferred.
+    """
+    batches = [entries[i:i + batch_size] for i in range(0, len(entries), batch_size)]
+    logger.info(f"Running detection on {len(entries)} images in {len(batches)} batches of up to {batch_size}")
+
+    with ThreadPoolExecutor(max_workers=PREFETCH_WORKERS) as executor:
+        pending = [executor.submit(decode_image, entry[2]) for entry in batches[0]] if batches else []
+        for batch_index, batch in enumerate(batches):
+            decoded = [future.result() for future in pending]
+            if batch_index + 1 < len(batches):
+                pending = [executor.submit(decode_image, entry[2]) for entry in batches[batch_index + 1]]
+
+            ready = [(entry, img) for entry, img in zip(batch, decoded) if img is not None]
+            if not ready:
+                continue
+
+            predictions = infer_batch(model, [img for _, img in ready])
+            yield [
+                (entry, summarize_prediction(prediction))
+                for (entry, _), prediction in zip(ready, predictions)
+                if prediction is not None
+            ]
+
+def shard_images(images, shard_index, shard_count):
+    """
+    Keeps the images belonging to one shard. Assignment hashes channel/filename
+    (not list position), so machines with slightly different image sets still
+    agree on who owns which image.
+    """
+    if shard_count <= 1:
+        return images
+    return [
+        image for image in images
+        if zlib.crc32(f"{image[0]}/{os.path.basename(image[2])}".encode('utf-8')) % shard_count == shard_index
+    ]
+
+def partition_output_file(day, channel_name):
+    """Results of a single channel-day run (see run_detection's `images`)."""
+    return f"{os.path.splitext(OUTPUT_FILE)[0]}/{day:%Y-%m-%d}/{channel_name}.csv"
+
+def shard_output_file(shard_index, shard_count):
+    if shard_count <= 1:
+        return OUTPUT_FILE
+    base, ext = os.path.splitext(OUTPUT_FILE)
+    return f"{base}.shard-{shard_index}-of-{shard_count}{ext}"
+
+def boxes_output_file(output_file):
+    """Per-box rows of a results CSV: data/raw/yolo_detections.csv -> data/raw/yolo_detections_boxes.csv"""
+    base, ext = os.path.splitext(output_file)
+    return f"{base}_boxes{ext}"
+
+def box_rows(results_list):
+    """Explodes the results' boxes into BOX_CSV_FIELDS rows; images without detections have none."""
+    return [
+        dict(zip(BOX_CSV_FIELDS, [row["message_id"], row["image_path"], box_index] + list(box)))
+        for row in results_list
+        for box_index, box in enumerate(row["boxes"])
+    ]
+
+def write_csv(path, fieldnames, rows):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        dict_writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+        dict_writer.writeheader()
+        dict_writer.writerows(rows)
+
+def write_results(output_file, results_list):
+    # Sorted by path so the CSVs are identical whatever order workers finished in
+    results_list.sort(key=lambda row: row["image_path"])
+    write_csv(output_file, CSV_FIELDS, results_list)
+    write_csv(boxes_output_file(output_file), BOX_CSV_FIELDS, box_rows(results_list))
+
+def write_lake(results_list):
+    """
+    Mirrors the full results (and their boxes) into the Parquet lake, one
+    partition per channel (the images' parent directory). Each run recomputes
+    every image, so the partitions are replaced rather than appended to.
+    """
+    channel = lambda record: {"channel": os.path.basename(os.path.dirname(record["image_path"]))}
+    records = [
+        {
+            "message_id": int(row["message_id"]),
+            "image_path": row["image_path"],
+            "detected_class": row["detected_class"],
+            "confidence_score": float(row["confidence_score"]),
+            "image_category": row["image_category"]
+        } for row in results_list
+    ]
+    partitions = replace_partitions("yolo_detections", records, channel)
+    boxes = [dict(row, message_id=int(row["message_id"])) for row in box_rows(results_list)]
+    # Channels left without any box still get their (now empty) partition replaced
+    box_partitions = replace_partitions("yolo_detection_boxes", boxes, channel, [channel(record) for record in records])
+    logger.info(f"Wrote {len(records)} detections and {len(boxes)} boxes to {partitions} + {box_partitions} lake partitions")
+
+def merge_shards(shard_count):
+    """Merges the per-shard CSVs (results and boxes) of a multi-machine run into OUTPUT_FILE."""
+    results_list = []
+    boxes = {}
+    for shard_index in range(shard_count):
+        shard_file = shard_output_file(shard_index, shard_count)
+        for path in (shard_file, boxes_output_file(shard_file)):
+            if not os.path.exists(path):
+                logger.error(f"Missing shard output: {path}")
+                return
+        with open(shard_file, 'r', encoding='utf-8') as f:
+            results_list.extend(csv.DictReader(f))
+        with open(boxes_output_file(shard_file), 'r', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                boxes.setdefault(row["image_path"], []).append((int(row["box_index"]), [
+                    int(row["class_id"]), row["class_name"],
+                    *(float(row[field]) for field in ("confidence", "x1", "y1", "x2", "y2"))
+                ]))
+
+    for row in results_list:
+        row["boxes"] = [box for _, box in sorted(boxes.get(row["image_path"], []))]
+
+    write_results(OUTPUT_FILE, results_list)
+    if WRITE_LAKE:
+        write_lake(results_list)
+    logger.success(f"Merged {shard_count} shards ({len(results_list)} images) into {OUTPUT_FILE}")
+
+# Model loaded once per worker process by _init_worker
+_worker_model = None
+
+def _init_worker(backend, num_threads):
+    global _worker_model
+    _worker_model = load_model(backend, num_threads)
+
+def _detect_in_worker(entries, batch_size):
+    return [pair for batch_results in detect_batches(_worker_model, entries, batch_size) for pair in batch_results]
+
+def detect_in_processes(entries, batch_size, workers, backend=INFERENCE_BACKEND):
+    """
+    Splits entries into chunks across a process pool and yields each chunk's
+    (entry, summary) pairs as it completes.
+    """
+    threads = THREADS_PER_WORKER or max(1, (os.cpu_count() or 1) // workers)
+    chunk_size = batch_size * 4
+    chunks = [entries[i:i + chunk_size] for i in range(0, len(entries), chunk_size)]
+    logger.info(f"Running detection on {len(entries)} images across {workers} processes ({threads} threads each)")
+
+    # spawn, not fork: forking a process that already initialized Torch can deadlock
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(backend, threads)
+    ) as executor:
+        futures = [executor.submit(_detect_in_worker, chunk, batch_size) for chunk in chunks]
+        for future in as_completed(futures):
+            yield future.result()
+
+def run_detection(batch_size=BATCH_SIZE, workers=DETECTION_WORKERS, shard_index=0, shard_count=1, backend=INFERENCE_BACKEND, model=None, images=None, output_file=None):
+    """
+    Detects objects in every image (or this shard's share) and writes the results.
+    `model` may be an already loaded model of `backend`, e.g. one kept warm by the
+    orchestrator; it is only used for in-process inference (workers == 1).
+    `images` ((channel, message_id, path) tuples) and `output_file` restrict a run
+    to a slice, e.g. one channel-day; such runs leave the lake alone, since its
+    detection partitions hold whole channels.
+    Writes the per-box rows next to the results (see boxes_output_file).
+    Images the image store maps to the same canonical picture (reposts) are
+    inferred once and share the result; other images are grouped by content.
+    Returns counts of images processed, served from cache, pictures inferred
+    and images that reused another image's result, and of boxes.
+    """
+    partial = images is not None
+    if images is None:
+        if not os.path.exists(IMAGE_DIR):
+            logger.error(f"Image directory not found: {IMAGE_DIR}")
+            return
+
+        logger.info(f"Scanning images in {IMAGE_DIR}...")
+        images = shard_images(discover_images(), shard_index, shard_count)
+        if shard_count > 1:
+            logger.info(f"Shard {shard_index + 1}/{shard_count}: {len(images)} images")
+    
+    results_list = []
+    misses = []
+    cache = DetectionCache(CACHE_FILE)
+    store = ImageStore(IMAGE_INDEX_FILE) if DEDUPE_IMAGES and os.path.exists(IMAGE_INDEX_FILE) else None
+    try:
+        if model is None and not os.path.exists(model_file(backend)):
+            # Ultralytics downloads missing weights on first load, hash them afterwards
+            try:
+                model = load_model(backend, THREADS_PER_WORKER)
             except Exception as e:
-                logger.warning(f"Error processing {img_path}: {e}")
+                logger.error(f"Failed to load model: {e}")
+                return
+        # Results from different weights or backends are cached separately
+        model_hash = cache.file_hash(model_file(backend))
+
+        # One detection per picture: the canonical hash of indexed images, the
+        # content hash of images scraped before the index existed
+        pictures = {}
+        for channel_name, message_id, img_path in images:
+            picture_hash = (store and store.canonical(img_path)) or cache.file_hash(img_path)
+            pictures.setdefault(picture_hash, []).append((channel_name, message_id, img_path))
+
+        # Serve unchanged pictures from the cache, only infer new or changed ones
+        for picture_hash, members in pictures.items():
+            cached = cache.get(picture_hash, model_hash, CONF_THRESHOLD)
+            if cached is not None:
+                results_list.extend({"message_id": message_id, "image_path": img_path, **cached} for _, message_id, img_path in members)
+            else:
+                channel_name, message_id, img_path = members[0]
+                misses.append((channel_name, message_id, img_path, picture_hash))
+        cache.commit()
+        to_infer = sum(len(pictures[entry[3]]) for entry in misses)
+        logger.info(
+            f"{len(images) - to_infer} images served from cache, {to_infer} to infer "
+            f"({len(misses)} distinct pictures)"
+        )
+
+        if misses:
+            if workers > 1:
+                batch_iter = detect_in_processes(misses, batch_size, workers, backend)
+            else:
+                if model is None:
+                    try:
+                        model = load_model(backend, THREADS_PER_WORKER)
+                    except Exception as e:
+                        logger.error(f"Failed to load model: {e}")
+                        return
+                batch_iter = detect_batches(model, misses, batch_size)
+
+            for batch_results in batch_iter:
+                for (_, _, _, picture_hash), summary in batch_results:
+                    cache.put(picture_hash, model_hash, CONF_THRESHOLD, summary)
+                    # Fan the result out to every message showing this picture
+                    results_list.extend({"message_id": message_id, "image_path": img_path, **summary} for _, message_id, img_path in pictures[picture_hash])
+                # Commit per batch so an interrupted run keeps the work it finished
+                cache.commit()
+    finally:
+        cache.close()
+        if store is not None:
+            store.close()
                 
     # Save results to CSV
-    os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
-    keys = ["message_id", "image_path", "detected_class", "confidence_score", "image_category"]
-    
-    with open(OUTPUT_FILE, 'w', newline='', encoding='utf-8') as f:
-        dict_writer = csv.DictWriter(f, fieldnames=keys)
-        dict_writer.writeheader()
-        dict_writer.writerows(results_list)
+    output_file = output_file or shard_output_file(shard_index, shard_count)
+    write_results(output_file, results_list)
+    # Sharded runs reach the lake through --merge-shards
+    if WRITE_LAKE and shard_count == 1 and not partial:
+        write_lake(results_list)
         
-    logger.success(f"Detection complete. Results saved to {OUTPUT_FILE}")
+    logger.success(f"Detection complete. {len(results_list)} images processed. Results saved to {output_file}")
+    return {
+        "images": len(results_list),
+        "cached": len(images) - to_infer,
+        "inferred": len(misses),
+        "deduplicated": len(images) - len(pictures),
+        "boxes": sum(len(row["boxes"]) for row in results_list),
+        "output_file": output_file
+    }
 
 if __name__ == "__main__":
-    run_detection()
+    import argparse
+    parser = argparse.ArgumentParser(description="Run YOLO object detection over scraped images.")
+    parser.add_argument("--workers", type=int, default=DETECTION_WORKERS, help="Worker processes, each with its own model instance")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Images per forward pass")
+    parser.add_argument("--shard-index", type=int, default=0, help="Which shard this machine processes (0-based)")
+    parser.add_argument("--shard-count", type=int, default=1, help="Total number of shards the backfill is split into")
+    parser.add_argument("--merge-shards", action="store_true", help="Merge the per-shard CSVs into the main output file and exit")
+    parser.add_argument("--backend", choices=["torch", "onnx"], default=INFERENCE_BACKEND, help="Inference backend")
+    parser.add_argument("--export-onnx", action="store_true", help="Export the PyTorch model to ONNX and exit")
+    parser.add_argument("--int8", action="store_true", help="With --export-onnx, quantize the exported model to INT8")
+    parser.add_argument("--verify-onnx", action="store_true", help="Compare ONNX and PyTorch results on sample images and exit")
+    args = parser.parse_args()
+
+    if not 0 <= args.shard_index < args.shard_count:
+        parser.error("--shard-index must be in [0, --shard-count)")
+
+    if args.export_onnx:
+        export_onnx(int8=args.int8)
+    elif args.verify_onnx:
+        raise SystemExit(0 if verify_onnx() else 1)
+    elif args.merge_shards:
+        merge_shards(args.shard_count)
+    else:
+        run_detection(
+            batch_size=args.batch_size,
+            workers=args.workers,
+            shard_index=args.shard_index,
+            shard_count=args.shard_count,
+            backend=args.backend
+        )
 
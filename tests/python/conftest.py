@@ -0,0 +1,28 @@
+import uuid
+import pytest
+
+@pytest.fixture
+def pg_conn():
+    """
+    Connection to a scratch database created next to the configured one
+    (POSTGRES_* settings) and dropped afterwards. Skips without a server.
+    """
+    psycopg2 = pytest.importorskip("psycopg2")
+    from scripts import load_to_postgres as db
+
+    try:
+        admin = psycopg2.connect(dbname=db.DB_NAME, user=db.DB_USER, password=db.DB_PASSWORD, host=db.DB_HOST, port=db.DB_PORT)
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"PostgreSQL not reachable: {e}")
+    admin.autocommit = True
+    name = f"{db.DB_NAME}_test_{uuid.uuid4().hex[:8]}"
+    with admin.cursor() as cur:
+        cur.execute(f'CREATE DATABASE "{name}";')
+    conn = psycopg2.connect(dbname=name, user=db.DB_USER, password=db.DB_PASSWORD, host=db.DB_HOST, port=db.DB_PORT)
+    try:
+        yield conn
+    finally:
+        conn.close()
+        with admin.cursor() as cur:
+            cur.execute(f'DROP DATABASE IF EXISTS "{name}";')
+        admin.close()
@@ -0,0 +1,64 @@
+import json
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from scripts import load_to_postgres
+
+def create_baseline_table(conn):
+    """raw.telegram_messages as the first version of the loader created it."""
+    with conn.cursor() as cur:
+        cur.execute("CREATE SCHEMA raw;")
+        cur.execute("""
+        CREATE TABLE raw.telegram_messages (
+            id SERIAL PRIMARY KEY,
+            message_id BIGINT,
+            channel_name TEXT,
+            date TIMESTAMP,
+            message_data JSONB,
+            UNIQUE(channel_name, message_id)
+        );
+        """)
+        cur.execute(
+            "INSERT INTO raw.telegram_messages (message_id, channel_name, date, message_data) VALUES (%s, %s, %s, %s), (%s, %s, %s, %s);",
+            (1, "chemed", "2023-11-02 10:00", json.dumps({"id": 1}), 2, "chemed", "2024-01-15 08:30", json.dumps({"id": 2}))
+        )
+    conn.commit()
+
+def test_migrates_baseline_table(pg_conn):
+    create_baseline_table(pg_conn)
+
+    load_to_postgres.create_table(pg_conn)
+
+    with pg_conn.cursor() as cur:
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = 'raw.telegram_messages'::regclass;")
+        assert cur.fetchone()[0] == 'p'
+        cur.execute("SELECT to_regclass('raw.telegram_messages_legacy');")
+        assert cur.fetchone()[0] is None
+        cur.execute("SELECT message_id, loaded_at IS NOT NULL FROM raw.telegram_messages ORDER BY message_id;")
+        assert cur.fetchall() == [(1, True), (2, True)]
+        # The upsert's conflict target exists on the migrated table
+        cur.execute("""
+        INSERT INTO raw.telegram_messages (message_id, channel_name, date, message_data)
+        VALUES (2, 'chemed', '2024-01-15 08:30', '{}')
+        ON CONFLICT (channel_name, message_id, date) DO NOTHING;
+        """)
+        assert cur.rowcount == 0
+
+def test_create_table_is_idempotent(pg_conn):
+    load_to_postgres.create_table(pg_conn)
+    load_to_postgres.create_table(pg_conn)
+
+    with pg_conn.cursor() as cur:
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = 'raw.telegram_messages'::regclass;")
+        assert cur.fetchone()[0] == 'p'
+
+def test_create_table_raises_on_failure(pg_conn):
+    with pg_conn.cursor() as cur:
+        # A non-table in the way makes the setup fail
+        cur.execute("CREATE SCHEMA raw;")
+        cur.execute("CREATE VIEW raw.telegram_messages AS SELECT 1 AS message_id;")
+    pg_conn.commit()
+
+    with pytest.raises(Exception):
+        load_to_postgres.create_table(pg_conn)
@@ -0,0 +1,71 @@
+import os
+import asyncio
+from datetime import date, datetime, timezone
+import pytest
+
+pytest.importorskip("telethon")
+
+from telethon.tl.types import MessageMediaPhoto
+from src import scraper
+
+DAY = date(2024, 3, 5)
+
+class FakeMessage:
+    def __init__(self, message_id, posted_at, photo=False):
+        self.id = message_id
+        self.date = posted_at
+        self.text = f"message {message_id}"
+        self.views = 10
+        self.forwards = 0
+        self.media = MessageMediaPhoto() if photo else None
+
+class FakeClient:
+    """The slice of TelegramClient that scrape_channel_day uses."""
+    def __init__(self, messages, download_fails=False):
+        self.messages = messages
+        self.download_fails = download_fails
+
+    async def get_entity(self, channel_name):
+        return channel_name
+
+    async def iter_messages(self, entity, offset_date=None):
+        for message in self.messages:
+            if message.date < offset_date:
+                yield message
+
+    async def download_media(self, message, file=None):
+        if self.download_fails:
+            raise ConnectionError("connection reset")
+        with open(file, "wb") as f:
+            f.write(b"jpeg")
+        return file
+
+@pytest.fixture
+def slice_dirs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(scraper, "DEDUPE_IMAGES", False)
+    monkeypatch.setattr(scraper, "WRITE_LAKE", False)
+    return tmp_path
+
+def messages():
+    # Newest first, as Telegram returns them; the last one is from the day before
+    return [
+        FakeMessage(3, datetime(2024, 3, 5, 18, 0, tzinfo=timezone.utc), photo=True),
+        FakeMessage(2, datetime(2024, 3, 5, 9, 0, tzinfo=timezone.utc)),
+        FakeMessage(1, datetime(2024, 3, 4, 23, 0, tzinfo=timezone.utc))
+    ]
+
+def test_scrape_channel_day_publishes_slice(slice_dirs):
+    count, output_path = asyncio.run(scraper.scrape_channel_day(FakeClient(messages()), "chemed", DAY))
+
+    assert count == 2
+    assert os.path.exists(output_path)
+    assert os.path.exists(os.path.join(scraper.DATA_DIR, "images", "chemed", "3.jpg"))
+
+def test_scrape_channel_day_fails_on_failed_download(slice_dirs):
+    with pytest.raises(RuntimeError, match="Failed to download 1 images"):
+        asyncio.run(scraper.scrape_channel_day(FakeClient(messages(), download_fails=True), "chemed", DAY))
+
+    # Nothing published, so the retry scrapes the slice from scratch
+    output_path = scraper.partition_output_prefix(DAY, "chemed") + scraper.OUTPUT_EXTENSIONS[scraper.OUTPUT_COMPRESSION]
+    assert not os.path.exists(output_path)